@@ -1,135 +1,190 @@
 import cmd
-import mysql.connector
-from mysql.connector import Error
+import argparse
+import cProfile
 import csv
+import heapq
+import itertools
 import os
+import sys
+from timetable import Timetable, trip_order
+from bulkload import BulkLoader
+from conflicts import ConflictIndex, departure_minutes
+from connections import ConnectionIndex
+from backends import BACKENDS, create_backend, to_fare
+from cache import ResultCache
+from instrumentation import Instrumentation
+from snapshot import ChangeLog, load_snapshot, save_snapshot
+from matrix import FareMatrix, fingerprint
+from parallel import READ_ONLY_COMMANDS, ParallelReader, capture
+from preflight import Preflight
+from sync import diff_timetable, read_timetable
+
+# Read commands whose printed output is cached until the data they depend on changes.
+# F is only cached with --limit; without it the trips are printed as they stream, never held.
+CACHED_COMMANDS = ('T', 'B', 'C', 'F')
 
 class DatabaseCLI(cmd.Cmd):
     intro = 'Welcome to Bus Routes Database CLI! Type "help" to list commands. To run your test file, enter the command "run".'
     prompt = 'Database CLI: '
 
-    # Constructor, holds csv file and generates database if needed
-    def __init__(self, csv_file):
+    # Constructor, holds csv file and the storage backend (MySQL unless another one is given)
+    def __init__(self, csv_file, backend=None, stats=None, change_log=None):
         super().__init__()
         self.csv_file = 'testcase/' + csv_file
-        self.connection = self.create_connection()
-        self.create_database("dbprog")  
+        self.stats = stats if stats is not None else Instrumentation()
+        self.backend = self.stats.wrap_backend(backend if backend is not None else create_backend('mysql'))
+        self.engine = 'sql'
+        self.timetable = None
+        self.conflicts = None
+        self.connection_index = None
+        self.matrix = None
+        self.cache = ResultCache()
+        self.change_log = change_log
+        self.changes = 0  # successful t, b, l, r and sync commands, to count what a replay applied
+        self.failed = False  # set by T, B, C and F when they caught an exception, so the output is not cached
 
     
     
-    # Base function to connect to database
-    def create_connection(self):
-        try:
-            connection = mysql.connector.connect(
-                host="localhost",
-                user="cs5330",
-                password="pw5330"  
-            )
-            if connection.is_connected():
-                print("Connecting to the Bus Routes server...")
-                return connection
-        except Error as e:
-            print(f"Error: {e}")
+    # Serves cached T, B, C and F --limit output; other commands run as usual. Every command is timed.
+    def onecmd(self, line):
+        with self.stats.command(self.parseline(line)[0]):
+            key = self.cache_key(line)
+            if key is None:
+                return super().onecmd(line)
+
+            output = self.cache.get(key)
+            if output is None:
+                output, tags = self.read_command(line)
+                self.remember(key, output, tags)
+            else:
+                # cmd.Cmd.onecmd is skipped on a hit, so an empty line repeats this command as it would after a miss
+                self.lastcmd = self.parseline(line)[2]
+
+            sys.stdout.write(output)
+
+
+
+    # The cache key for a T, B, C or F --limit line, None for any other command
+    def cache_key(self, line):
+        command, arg, line = self.parseline(line)
+        if command not in CACHED_COMMANDS or (command == 'F' and '--limit' not in arg.split()):
             return None
+        return (command, tuple(arg.split()))
 
-    
-    # If database does not exist, create it. Catches test case of no database
-    def create_database(self, db_name):
-        cursor = self.connection.cursor()
-        try:
-            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {db_name}")
-            cursor.execute("USE dbprog")
-        except Error as e:
-            print(f"Error: {e}")
-        finally:
-            cursor.close()
-    
-    
-    
-    # Function to generate tables, used in functions below 
-    def generate(self):
-        """Generates missing tables: Terminal, Route, and LeaveTime."""
-        
+
+
+    # Runs a read command without the cache, returning its printed output and cache tags.
+    # A command that caught an exception gets no tags, so a passing failure is never cached.
+    def read_command(self, line):
+        command, arg, line = self.parseline(line)
+        self.failed = False
+        with capture() as buffer:
+            cmd.Cmd.onecmd(self, line)
+        tags = self.cache_tags(command, tuple(arg.split())) if command in CACHED_COMMANDS and not self.failed else None
+        return buffer.getvalue(), tags
+
+
+
+    # Stores a result in the cache; failed commands come without tags and are not cached, so the next call retries
+    def remember(self, key, output, tags):
+        if tags is not None:
+            self.cache.put(key, output, tags)
+
+
+
+    # A CLI on another backend connection, for running read commands on a worker thread
+    def worker(self, backend):
+        worker = DatabaseCLI('', backend, self.stats)
+        worker.csv_file = self.csv_file
+        worker.engine = self.engine
+        worker.timetable = self.timetable
+        worker.connection_index = self.connection_index
+        worker.matrix = self.matrix
+        return worker
+
+
+
+    # The terminals and routes a cached result depends on, with names compared as the backend compares them
+    def cache_tags(self, command, arguments):
+        key = self.backend.name_key
         try:
-            with self.connection.cursor() as cursor:
-            
-                cursor.execute("USE dbprog")
-                cursor.execute("""
-                    SELECT table_name
-                    FROM information_schema.tables
-                    WHERE table_schema = 'dbprog' 
-                    AND table_name IN ('Terminal', 'Route', 'LeaveTime')
-                """)
-                existing_tables = {row[0] for row in cursor.fetchall()}
-
-                # Create Terminal table if it doesn't exist
-                if 'Terminal' not in existing_tables:
-                    cursor.execute("""
-                        CREATE TABLE Terminal (
-                            Name VARCHAR(255) PRIMARY KEY, 
-                            District VARCHAR(255)
-                        )
-                    """)
-                    print("Table 'Terminal' created.")
-
-                # Create Route table if it doesn't exist
-                if 'Route' not in existing_tables:
-                    cursor.execute("""
-                        CREATE TABLE Route (
-                            RouteNum INT PRIMARY KEY, 
-                            Source VARCHAR(255),
-                            Destination VARCHAR(255),
-                            TravelTime INT CHECK (TravelTime > 0), 
-                            Fare DECIMAL(5,2) CHECK (Fare > 0),
-                            FOREIGN KEY (Source) REFERENCES Terminal(Name),
-                            FOREIGN KEY (Destination) REFERENCES Terminal(Name)
-                        )
-                    """)
-                    print("Table 'Route' created.")
-
-                # Create LeaveTime table if it doesn't exist
-                if 'LeaveTime' not in existing_tables:
-                    cursor.execute("""
-                        CREATE TABLE LeaveTime (
-                            RouteNum INT, 
-                            LeaveTime TIME,
-                            PRIMARY KEY(RouteNum, LeaveTime),
-                            FOREIGN KEY (RouteNum) REFERENCES Route(RouteNum)
-                        )
-                    """)
-                    print("Table 'LeaveTime' created.")
-
-            self.connection.commit()
+            if command == 'B':
+                return {('route', int(route) if route.lstrip('-').isdigit() else route) for route in arguments}
+
+            tags = {('terminal', key(name)) for name in (arguments if command == 'T' else arguments[:2])}
+            # Any new one- or two-change trip for F passes through a terminal next to one of the ends
+            if command == 'F' and len(arguments) >= 2:
+                tags.update(('terminal', key(name)) for name in self.backend.adjacent_terminals(arguments[0], arguments[1]))
+            return tags
+
+        except Exception:
+            return None
+
+
+
+    # Called after a t, b or l row is stored: logs it, drops in-memory copies and cached results using it
+    def changed(self, command, params):
+        self.changes += 1
+        if self.change_log is not None:
+            self.change_log.record(command, params)
+        self.timetable = None
+        if command == 'b':
+            self.matrix = None
+            if self.connection_index is not None:
+                self.connection_index.add(params[0], params[1], params[2], to_fare(params[4]))
+        if not self.cache.entries:
+            return
+
+        key = self.backend.name_key
+        if command == 't':
+            tags = {('terminal', key(params[0]))}
+        elif command == 'b':
+            tags = {('route', params[0]), ('terminal', key(params[1])), ('terminal', key(params[2]))}
+        else:
+            tags = {('route', params[0])}
+            route = self.backend.route(params[0])
+            if route is not None:
+                tags.update({('terminal', key(route[1])), ('terminal', key(route[2]))})
+        self.cache.invalidate(tags)
+
+
+
+    # Loads Terminal, Route and LeaveTime into memory for the F command, reused until data changes
+    def load_timetable(self):
+        if self.timetable is None:
+            self.timetable = Timetable(*self.backend.dump(), self.backend.name_key)
+        return self.timetable
+
+
+
+    # Loads existing departures into the conflict index used by l, kept in sync by l and r
+    def load_conflicts(self):
+        if self.conflicts is None:
+            terminals, routes, departures = self.backend.dump()
+            self.conflicts = ConflictIndex(departures)
+        return self.conflicts
+
+
+
+    # Loads every route into the one-change index used by C, kept in sync by b and r
+    def load_connections(self):
+        if self.connection_index is None:
+            terminals, routes, departures = self.backend.dump()
+            self.connection_index = ConnectionIndex(routes, self.backend.name_key)
+        return self.connection_index
+
 
-        except Exception as e:
-            print(f"An error occurred during table creation: {e}")
 
-    
-    
-    
     # Function to check for tables
     def do_e(self, arg):
         'Checks if Tables Exist (If tables do not exist, generates tables): e'
-        
-        cursor = self.connection.cursor()
+
         try:
-            cursor.execute("USE dbprog")
-            cursor.execute("""
-                SELECT table_name
-                FROM information_schema.tables
-                WHERE table_schema = 'dbprog' 
-                AND table_name IN ('Terminal', 'Route', 'LeaveTime')
-            """)
-            existing_tables = {row[0] for row in cursor.fetchall()}
-
-        # If all tables exist, state they do. If not go to error block to generate missing tables.
-            if {'Terminal', 'Route', 'LeaveTime'}.issubset(existing_tables):
-                return
-            else:
-                self.generate()
+            for table in self.backend.ensure_schema():
+                print(f"Table '{table}' created.")
 
-        finally:
-            cursor.close()
+        except Exception as e:
+            print(f"An error occurred during table creation: {e}")
     
     
     
@@ -137,24 +192,21 @@ class DatabaseCLI(cmd.Cmd):
     def do_r(self, arg):
         'Clears all data from tables (If tables do not exist, generates tables): r'
 
-        cursor = self.connection.cursor()
         try:
-            cursor.execute("USE dbprog")
-
-            # Clear data with DELETE, which respects foreign key constraints
-            cursor.execute("DELETE FROM LeaveTime;")
-            cursor.execute("DELETE FROM Route;")
-            cursor.execute("DELETE FROM Terminal;")
-            
-            self.connection.commit()
+            self.backend.clear()
+            self.timetable = None
+            self.conflicts = ConflictIndex()
+            self.connection_index = ConnectionIndex(name_key=self.backend.name_key)
+            self.matrix = None
+            self.cache.clear()
+            self.changes += 1
+            if self.change_log is not None:
+                self.change_log.append(['r'])
             print('Data from tables deleted')
 
-        except Error as e:
+        except Exception as e:
             print(f"Error: {e}")
 
-        finally:
-            cursor.close()
-
     
 
     
@@ -162,7 +214,6 @@ class DatabaseCLI(cmd.Cmd):
     def do_t(self, arg):
         'Adds a new terminal: t <name of terminal>  <district>'
         
-        cursor = self.connection.cursor()
         try:
             arguments = arg.split()
 
@@ -172,83 +223,47 @@ class DatabaseCLI(cmd.Cmd):
             
             name = arguments[0]
             district = arguments[1]
-            cursor.execute("USE dbprog")
-            cursor.execute("""
-                INSERT INTO Terminal (Name, District)
-                VALUES (%s, %s)""", (name, district))
-            self.connection.commit()
+            self.backend.add_terminal(name, district)
+            self.changed('t', (name, district))
         
         except Exception as e:
-            self.connection.rollback()
             print(f"t, {name}, {district} Input Invalid")
-        
-        finally:
-            cursor.close()
 
 
-    # Function to list information about a terminal 
+    # Function to list information about one or more terminals
     def do_T(self, arg):
-        'Lists information about terminal: T <terminal name>'
-
-        cursor = self.connection.cursor()
+        'Lists information about terminals: T <terminal name> [<terminal name> ...]'
 
         try:
-            cursor.execute("USE dbprog")
             arguments = arg.split()
 
-            if len(arguments) != 1:
+            if len(arguments) < 1:
                 print(f"T, {terminal} Invalid Input")
                 return
 
             # Get the terminal name from arguments
             terminal = arguments[0]
 
-            # Query to select terminal information
-            cursor.execute("""
-                SELECT Name, District
-                FROM Terminal
-                WHERE Name = %s
-            """, (terminal,))
-            terminal_info = cursor.fetchone()
+            # Terminal rows with the routes leaving and reaching them, for all names in one query
+            for terminal, terminal_info in zip(arguments, self.backend.terminal_details(arguments)):
+                if not terminal_info:
+                    print(f"T, {terminal} Invalid Input")
+                    continue
 
-            if not terminal_info:
-                print(f"T, {terminal} Invalid Input")
-                return
+                # Prepare the output
+                terminal_name, district, source_routes, destination_routes = terminal_info
+                source_count = len(source_routes)
+                destination_count = len(destination_routes)
 
-            # Query for routes with this terminal as the source
-            cursor.execute("""
-                SELECT RouteNum
-                FROM Route
-                WHERE Source = %s
-                ORDER BY RouteNum ASC
-            """, (terminal,))
-            source_routes = cursor.fetchall()
-            
-            # Query for routes with this terminal as the destination
-            cursor.execute("""
-                SELECT RouteNum
-                FROM Route
-                WHERE Destination = %s
-                ORDER BY RouteNum ASC
-            """, (terminal,))
-            destination_routes = cursor.fetchall()
-
-            # Prepare the output
-            terminal_name, district = terminal_info
-            source_count = len(source_routes)
-            destination_count = len(destination_routes)
-
-            # Print the output in the specified format
-            print(f'{terminal_name} {district}')
-            print(f'{source_count} ' + ", ".join(str(route[0]) for route in source_routes))
-            print(f"{destination_count} " + ", ".join(str(route[0]) for route in destination_routes))
+                # Print the output in the specified format
+                print(f'{terminal_name} {district}')
+                print(f'{source_count} ' + ", ".join(str(route) for route in source_routes))
+                print(f"{destination_count} " + ", ".join(str(route) for route in destination_routes))
 
         except Exception as e:
+            self.failed = True
             print(f"T, {terminal} Invalid Input")
 
-        finally:
-            cursor.close()
-
 
     def do_l(self, arg):
         """Records the departure time of a bus for a specific route, ensuring no conflicts in schedule and valid times."""
@@ -272,170 +287,86 @@ class DatabaseCLI(cmd.Cmd):
             return
 
         start_time_str = arguments[1]
-        if len(start_time_str) != 4 or not start_time_str.isdigit():
-            print(f"l, {route_number}, {start_time_str} Invalid Input")
-            return
 
-        # Convert hours and minutes, validate time range (test case 3100)
-        hours, minutes = int(start_time_str[:2]), int(start_time_str[2:])
-        if hours < 5 or (hours == 23 and minutes > 0) or hours > 23 or minutes < 0 or minutes > 59:
+        # Convert hhmm to minutes, validate time range (test case 3100)
+        departure = departure_minutes(start_time_str)
+        if departure is None:
             print(f"l, {route_number}, {start_time_str} Invalid Input")
             return
 
-        # Convert start time to hh:mm format for MySQL
-        start_time = f"{start_time_str[:2]}:{start_time_str[2:]}:00"
-
         try:
-            with self.connection.cursor() as cursor:
-                
-                cursor.execute("USE dbprog")
-
-                # Check for conflicts with other buses on the same route
-                cursor.execute("""
-                    SELECT LeaveTime
-                    FROM LeaveTime
-                    WHERE RouteNum = %s AND (
-                        LeaveTime >= SUBTIME(%s, '00:14:00') AND LeaveTime <= ADDTIME(%s, '00:14:00')
-                    )
-                """, (route_number, start_time, start_time))
-
-                conflicts_on_route = cursor.fetchall()
-
-                # Check for conflicts with all buses (different routes)
-                cursor.execute("""
-                    SELECT LeaveTime
-                    FROM LeaveTime
-                    WHERE LeaveTime = %s
-                """, (start_time,))
-
-                conflicts_at_same_time = cursor.fetchall()
-
-                if conflicts_on_route or conflicts_at_same_time:
-                    print(f"l, {route_number}, {start_time_str} Invalid Input")
-                    return
-
-                # Insert the new departure time for the specified route
-                cursor.execute("""
-                    INSERT INTO LeaveTime (RouteNum, LeaveTime)
-                    VALUES (%s, %s)
-                """, (route_number, start_time))
+            # Check for conflicts on the same route (within 14 minutes) and with all buses (same time)
+            if self.load_conflicts().conflicts(route_number, departure):
+                print(f"l, {route_number}, {start_time_str} Invalid Input")
+                return
 
-                self.connection.commit()
+            # Insert the new departure time for the specified route
+            self.backend.add_departure(route_number, departure)
+            self.conflicts.add(route_number, departure)
+            self.changed('l', (route_number, departure))
 
         except Exception as e:
             print(f"l, {route_number}, {start_time_str} Invalid Input")
 
 
 
-    # Function to return information about a route 
+    # Function to return information about one or more routes
     def do_B(self, arg):
-        'Returns information about a certain Route: B <route number>'
-
-        cursor = self.connection.cursor()
+        'Returns information about certain Routes: B <route number> [<route number> ...]'
 
         try:
-            
-            cursor.execute("USE dbprog")
-            route_num = arg.strip()
+            route_nums = arg.split()
 
             # Ensure a route number is provided
-            if not route_num:
-                print("Invalid Input: The command requires exactly one argument: <route number>")
+            if not route_nums:
+                print("Invalid Input: The command requires at least one argument: <route number> [<route number> ...]")
                 return
 
-            # Fetch route information: route number, source, destination, travel time, and fare
-            cursor.execute("""
-                SELECT RouteNum, Source, Destination, TravelTime, Fare
-                FROM Route
-                WHERE RouteNum = %s
-            """, (route_num,))
-            route_info = cursor.fetchone()
+            # Route rows (route number, source, destination, travel time, fare) with their leave times, in one query
+            for route_num, route_info in zip(route_nums, self.backend.route_details(route_nums)):
+                if not route_info:
+                    print(f"Route '{route_num}' not found in the database.")
+                    continue
 
-            if route_info:
-                route_number, source, destination, travel_time, fare = route_info
+                (route_number, source, destination, travel_time, fare), leave_times = route_info
                 # Print route information
                 print(f"{route_number} {source} {destination} "
                     f"{travel_time} {fare:.2f}")
-            else:
-                print(f"Route '{route_num}' not found in the database.")
-                return
-
-            # Fetch leave times for the route in ascending order
-            cursor.execute("""
-                SELECT LeaveTime
-                FROM LeaveTime
-                WHERE RouteNum = %s
-                ORDER BY LeaveTime ASC
-            """, (route_num,))
-            leave_times = cursor.fetchall()
 
-            
-            leave_times_str = " ".join(str(time[0]).split(":")[0] + ":" + str(time[0]).split(":")[1] for time in leave_times)
-            if leave_times_str:
-                print(leave_times_str)
+                # Times print as h:mm, like str() of the TIME value
+                leave_times_str = " ".join(f"{time // 60}:{time % 60:02d}" for time in leave_times)
+                if leave_times_str:
+                    print(leave_times_str)
 
 
         except Exception as e:
+            self.failed = True
             print(f"Error: {e}")
 
-        finally:
-            cursor.close()
-
 
 
     # Function that returns all districts and the routes they use
     def do_D(self, arg):
         'Returns information about all districts and routes that use it: D'
 
-        cursor = self.connection.cursor()
-        
         try:
-            cursor.execute("USE dbprog")
-            cursor.execute("""
-                SELECT DISTINCT District
-                FROM Terminal
-            """)
-            districts = cursor.fetchall()
-
-            # Counting for each district
-            for district_row in districts:
-                district = district_row[0]
-
-                
-                cursor.execute("""
-                    SELECT COUNT(*)
-                    FROM Route
-                    WHERE Source IN (SELECT Name FROM Terminal WHERE District = %s)
-                """, (district,))
-                source_count = cursor.fetchone()[0]
-                
-                
-                cursor.execute("""
-                    SELECT COUNT(*)
-                    FROM Route
-                    WHERE Destination IN (SELECT Name FROM Terminal WHERE District = %s)
-                """, (district,))
-                destination_count = cursor.fetchone()[0]
-
-                # Display the result for the district
+            # One grouped pass: each route is counted once as a source and once as a destination
+            districts = self.backend.district_counts()
+
+            # Display the result for each district
+            for district, source_count, destination_count in districts:
                 print(f"{district} {source_count} {destination_count}")
 
         except Exception as e:
             print(f"Error: {e}")
 
-        finally:
-            cursor.close()
-
     
         
     # Function to find  bus routes from source to destination in within one transfer (NEEDS WORK)
     def do_C(self, arg):
         'Finds bus routes from source to destination within one bus change: C <source terminal> <destination terminal>'
 
-        cursor = self.connection.cursor()
-
         try:
-            cursor.execute("USE dbprog")
             arguments = arg.split()
 
             if len(arguments) != 2:
@@ -444,28 +375,18 @@ class DatabaseCLI(cmd.Cmd):
 
             source, destination = arguments
 
-            # Finds the direct routes from source to destination
-            cursor.execute("""
-                SELECT RouteNum, Fare
-                FROM Route
-                WHERE Source = %s AND Destination = %s
-            """, (source, destination))
-            direct_routes = cursor.fetchall()
+            # A fare matrix showing no path within two buses answers without building the index
+            if self.matrix is not None and not self.matrix.within(source, destination, 2):
+                print("None")
+                return
+
+            # Looks up the direct routes and one-transfer routes from source to destination, already sorted
+            direct_routes, transfer_routes = self.load_connections().lookup(source, destination)
 
             for route_num, fare in direct_routes:
                 print(f"{route_num} {fare:.2f}")
 
-            # Finds one-transfer routes
-            cursor.execute("""
-                SELECT R1.RouteNum, R1.Destination, R1.Fare, R2.RouteNum, R2.Fare
-                FROM Route R1
-                JOIN Route R2 ON R1.Destination = R2.Source
-                WHERE R1.Source = %s AND R2.Destination = %s
-            """, (source, destination))
-            transfer_routes = cursor.fetchall()
-
-            for route_num1, intermediate, fare1, route_num2, fare2 in transfer_routes:
-                total_fare = fare1 + fare2
+            for route_num1, route_num2, total_fare in transfer_routes:
                 print(f"{route_num1} {route_num2} {total_fare:.2f}")
 
             # Case for if no routes found
@@ -473,24 +394,27 @@ class DatabaseCLI(cmd.Cmd):
                 print("None")
 
         except Exception as e:
+            self.failed = True
             print(f"Error: {e}")
 
-        finally:
-            cursor.close()
-
     
 
     # Function to find bus routes from source to destination given a starting time in two transfers 
     def do_F(self, arg):
-        'Finds bus routes from source to destination within two bus changes given a starting time: F <source terminal> <destination terminal> <time>'
+        'Finds bus routes from source to destination within two bus changes given a starting time: F <source terminal> <destination terminal> <time> [--limit N]'
         
-        results = []  
-
         try:
-            cursor = self.connection.cursor()
-            cursor.execute("USE dbprog")
             arguments = arg.split()
 
+            # An optional --limit N prints only the first N trips
+            limit = None
+            if len(arguments) == 5 and arguments[3] == '--limit':
+                if not arguments[4].isdigit():
+                    print("Invalid Input: The limit must be a whole number")
+                    return
+                limit = int(arguments[4])
+                arguments = arguments[:3]
+
             if len(arguments) != 3:
                 print("Invalid Input: The command requires exactly three arguments: <source terminal> <destination terminal> <time>")
                 return
@@ -508,93 +432,133 @@ class DatabaseCLI(cmd.Cmd):
             start_total_minutes = start_hours * 60 + start_minutes
             end_total_minutes = start_total_minutes + 60  # End time is 1 hour after start time
 
-            # Find direct routes from source to destination
-            cursor.execute("""
-                SELECT R.RouteNum, R.Fare, R.TravelTime, 
-                    (HOUR(L.LeaveTime) * 60 + MINUTE(L.LeaveTime)) AS LeaveTimeMinutes
-                FROM Route R
-                JOIN LeaveTime L ON R.RouteNum = L.RouteNum
-                WHERE R.Source = %s AND R.Destination = %s
-                AND (HOUR(L.LeaveTime) * 60 + MINUTE(L.LeaveTime)) >= %s
-                AND (HOUR(L.LeaveTime) * 60 + MINUTE(L.LeaveTime)) <= %s
-                ORDER BY LeaveTimeMinutes ASC
-            """, (source, destination, start_total_minutes, end_total_minutes))
-
-            direct_routes = cursor.fetchall()
-
-            if direct_routes:
-                for route_num, fare, travel_time, leave_time_minutes in direct_routes:
-                    arrival_time_minutes = leave_time_minutes + travel_time
-                    total_travel_time = arrival_time_minutes - start_total_minutes
-                    results.append((route_num, fare, total_travel_time))  # Store the result
-
-            # Find one-transfer routes
-            cursor.execute("""
-                SELECT R1.RouteNum AS first_route, R1.Fare AS fare1, R1.TravelTime AS travel_time1, 
-                    (HOUR(L1.LeaveTime) * 60 + MINUTE(L1.LeaveTime)) AS leave_time1,
-                    R2.RouteNum AS second_route, R2.Fare AS fare2, R2.TravelTime AS travel_time2, 
-                    (HOUR(L2.LeaveTime) * 60 + MINUTE(L2.LeaveTime)) AS leave_time2
-                FROM Route R1
-                JOIN LeaveTime L1 ON R1.RouteNum = L1.RouteNum
-                JOIN Route R2 ON R1.Destination = R2.Source
-                JOIN LeaveTime L2 ON R2.RouteNum = L2.RouteNum
-                WHERE R1.Source = %s AND R2.Destination = %s
-                AND (HOUR(L1.LeaveTime) * 60 + MINUTE(L1.LeaveTime)) >= %s
-                AND (HOUR(L1.LeaveTime) * 60 + MINUTE(L1.LeaveTime)) <= %s
-                AND (HOUR(L2.LeaveTime) * 60 + MINUTE(L2.LeaveTime)) >= (HOUR(L1.LeaveTime) * 60 + MINUTE(L1.LeaveTime)) + 5
-                ORDER BY leave_time1, leave_time2 ASC
-            """, (source, destination, start_total_minutes, end_total_minutes))
-
-            one_transfer_routes = cursor.fetchall()
-
-            if one_transfer_routes:
-                for first_route, fare1, travel_time1, leave_time1, second_route, fare2, travel_time2, leave_time2 in one_transfer_routes:
-                    total_fare = fare1 + fare2
-                    arrival_time_first_leg = leave_time1 + travel_time1
-                    total_travel_time = (leave_time2 - arrival_time_first_leg + 20) + travel_time2  # Including travel time and waiting
-                    results.append((first_route, second_route, total_fare, total_travel_time))  # Store the result
-
-            # Find two-transfer routes
-            cursor.execute("""
-                SELECT R1.RouteNum AS first_route, R1.Fare AS fare1, R1.TravelTime AS travel_time1, 
-                    (HOUR(L1.LeaveTime) * 60 + MINUTE(L1.LeaveTime)) AS leave_time1,
-                    R2.RouteNum AS second_route, R2.Fare AS fare2, R2.TravelTime AS travel_time2, 
-                    (HOUR(L2.LeaveTime) * 60 + MINUTE(L2.LeaveTime)) AS leave_time2,
-                    R3.RouteNum AS third_route, R3.Fare AS fare3, R3.TravelTime AS travel_time3, 
-                    (HOUR(L3.LeaveTime) * 60 + MINUTE(L3.LeaveTime)) AS leave_time3
-                FROM Route R1
-                JOIN LeaveTime L1 ON R1.RouteNum = L1.RouteNum
-                JOIN Route R2 ON R1.Destination = R2.Source
-                JOIN LeaveTime L2 ON R2.RouteNum = L2.RouteNum
-                JOIN Route R3 ON R2.Destination = R3.Source
-                JOIN LeaveTime L3 ON R3.RouteNum = L3.RouteNum
-                WHERE R1.Source = %s AND R3.Destination = %s
-                AND (HOUR(L1.LeaveTime) * 60 + MINUTE(L1.LeaveTime)) >= %s
-                AND (HOUR(L1.LeaveTime) * 60 + MINUTE(L1.LeaveTime)) <= %s
-                AND (HOUR(L2.LeaveTime) * 60 + MINUTE(L2.LeaveTime)) >= (HOUR(L1.LeaveTime) * 60 + MINUTE(L1.LeaveTime)) + 5
-                AND (HOUR(L3.LeaveTime) * 60 + MINUTE(L3.LeaveTime)) >= (HOUR(L2.LeaveTime) * 60 + MINUTE(L2.LeaveTime)) + 5
-                ORDER BY leave_time1, leave_time2, leave_time3 ASC
-            """, (source, destination, start_total_minutes, end_total_minutes))
-
-            two_transfer_routes = cursor.fetchall()
-
-            if two_transfer_routes:
-                for first_route, fare1, travel_time1, leave_time1, second_route, fare2, travel_time2, leave_time2, third_route, fare3, travel_time3, leave_time3 in two_transfer_routes:
-                    total_fare = fare1 + fare2 + fare3
-                    arrival_time_second_leg = leave_time2 + travel_time2
-                    total_travel_time = (arrival_time_second_leg - start_total_minutes + 20) + travel_time3  
-                    results.append((first_route, second_route, third_route, total_fare, total_travel_time))  
-                
-            results.sort(key=lambda x: (x[-1], x[0] if len(x) == 3 else x[1] if len(x) == 4 else x[2]))
+            # The memory engine answers from the loaded timetable instead of the backend queries
+            if self.engine == 'memory':
+                streams = self.load_timetable().trip_streams(source, destination, start_total_minutes, limit)
+            else:
+                streams = self.backend.trip_streams(source, destination, start_total_minutes, end_total_minutes, limit)
+            streams = [iter(stream) for stream in streams]
+
+            # Each stream is already in print order, so a heap merge prints them without holding them
+            results = heapq.merge(*streams, key=trip_order)
+            if limit is not None:
+                results = itertools.islice(results, limit)
 
             for result in results:
                 print(" ".join(map(str, result)))
 
+            # Read the streams to the end so no result set is left open
+            for stream in streams:
+                for _ in stream:
+                    pass
+
+        except Exception as e:
+            self.failed = True
+            print(f"Error: {e}")
+
+
+
+    # Function to precompute fares and bus counts between all terminals
+    def do_matrix(self, arg):
+        'Computes the cheapest fare and fewest buses for every pair of terminals into <prefix>.bin and <prefix>.csv, or loads a saved matrix: matrix build <prefix> [workers] | matrix load <prefix>'
+
+        try:
+            arguments = arg.split()
+            if len(arguments) not in (2, 3) or arguments[0] not in ('build', 'load') or (len(arguments) == 3 and not arguments[2].isdigit()):
+                print("Invalid Input: Use matrix build <prefix> [workers] or matrix load <prefix>")
+                return
+
+            action, prefix = arguments[:2]
+            terminals, routes, departures = self.backend.dump()
+            if action == 'load':
+                # Only a matrix built from the stored terminals and routes is loaded
+                self.matrix = FareMatrix.load(prefix, fingerprint([name for name, district in terminals], routes), self.backend.name_key)
+                print(f"Matrix loaded: {len(self.matrix.terminals)} terminals")
+                return
+
+            workers = int(arguments[2]) if len(arguments) == 3 else None
+            self.matrix = FareMatrix.build([name for name, district in terminals], routes, workers, self.backend.name_key)
+            self.matrix.save(prefix)
+            print(f"Matrix written to {prefix}.bin and {prefix}.csv: {len(self.matrix.terminals)} terminals")
+
         except Exception as e:
             print(f"Error: {e}")
 
-        finally:
-            cursor.close()
+
+
+    # Function to find the best journeys from source to destination with any number of bus changes up to a limit
+    def do_J(self, arg):
+        'Finds the journeys not beaten on arrival time, fare and bus changes together: J <source terminal> <destination terminal> <time> [max changes, default 2]'
+
+        try:
+            arguments = arg.split()
+
+            if len(arguments) not in (3, 4):
+                print("Invalid Input: The command requires three or four arguments: <source terminal> <destination terminal> <time> [max changes]")
+                return
+
+            source, destination, start_time_str = arguments[:3]
+
+            # Validate start time
+            if len(start_time_str) != 4 or not start_time_str.isdigit():
+                print("Invalid Input: Start time must be in hhmm format (e.g., 0730 for 7:30 am).")
+                return
+
+            max_transfers = 2
+            if len(arguments) == 4:
+                if not arguments[3].isdigit():
+                    print("Invalid Input: The number of bus changes must be a whole number")
+                    return
+                max_transfers = int(arguments[3])
+
+            start_total_minutes = int(start_time_str[:2]) * 60 + int(start_time_str[2:])
+            journeys = self.load_timetable().journeys(source, destination, start_total_minutes, max_transfers)
+
+            # Each line: the routes taken, the total fare, the arrival time and the number of changes
+            for arrival, fare, transfers, legs in journeys:
+                routes = " ".join(str(route_num) for route_num, leave_time in legs)
+                print(f"{routes} {fare:.2f} {arrival // 60}:{arrival % 60:02d} {transfers}")
+
+            if not journeys:
+                print("None")
+
+        except Exception as e:
+            print(f"Error: {e}")
+
+
+
+    # Function to find when a rider at a terminal can reach another one
+    def do_A(self, arg):
+        'Finds the earliest arrival at destination when at source from a given time, any number of bus changes: A <source terminal> <destination terminal> <time>'
+
+        try:
+            arguments = arg.split()
+
+            if len(arguments) != 3:
+                print("Invalid Input: The command requires exactly three arguments: <source terminal> <destination terminal> <time>")
+                return
+
+            source, destination, start_time_str = arguments
+
+            # Validate start time
+            if len(start_time_str) != 4 or not start_time_str.isdigit():
+                print("Invalid Input: Start time must be in hhmm format (e.g., 0730 for 7:30 am).")
+                return
+
+            start_total_minutes = int(start_time_str[:2]) * 60 + int(start_time_str[2:])
+            legs = self.load_timetable().earliest_arrival(source, destination, start_total_minutes)
+            if legs is None:
+                print("None")
+                return
+
+            # One line per bus: route, departure and arrival, then the arrival at the destination
+            for route_num, leave_time, arrive_time in legs:
+                print(f"{route_num} {leave_time // 60}:{leave_time % 60:02d} {arrive_time // 60}:{arrive_time % 60:02d}")
+            arrival = legs[-1][2]
+            print(f"Arrive {arrival // 60}:{arrival % 60:02d}")
+
+        except Exception as e:
+            print(f"Error: {e}")
 
 
 
@@ -602,9 +566,7 @@ class DatabaseCLI(cmd.Cmd):
     def do_b(self, arg):
         'Enters information about a bus route: b <route number> <source terminal> <destination terminal> <travel time> <fare>'
 
-        cursor = self.connection.cursor()
         try:
-            cursor.execute("USE dbprog")
             arguments = arg.split()
 
             # Check if we have exactly five arguments
@@ -620,31 +582,60 @@ class DatabaseCLI(cmd.Cmd):
             fare = float(arguments[4])
 
             # Insert the route into the table
-            cursor.execute("""
-                INSERT INTO Route (RouteNum, Source, Destination, TravelTime, Fare)
-                VALUES (%s, %s, %s, %s, %s)
-            """, (route_num, source_terminal, destination_terminal, travel_time, fare))
-        
-            self.connection.commit()
+            self.backend.add_route(route_num, source_terminal, destination_terminal, travel_time, fare)
+            self.changed('b', (route_num, source_terminal, destination_terminal, travel_time, fare))
         
         except Exception as e:
-            self.connection.rollback()
             print(f"b, {route_num}, {source_terminal}, {destination_terminal}, {travel_time}, {fare} Invalid Input")
-
-        finally:
-            cursor.close()
     
 
   
     # Function to run file commands
     def do_run(self, arg):
-        'Runs selected command file: run'
+        'Runs selected command file, batching inserts in bulk mode and reads in parallel mode: run [bulk] [parallel] [--profile <file>] [--trace <file>]'
         
+        parallel = None
+        profiler = None
+        trace_path = None
         try:
+            # --profile writes cProfile stats for the whole replay, --trace a Chrome trace (chrome://tracing)
+            options = []
+            paths = {}
+            words = arg.split()
+            while words:
+                word = words.pop(0)
+                if word in ('--profile', '--trace') and words:
+                    paths[word] = words.pop(0)
+                elif word in ('bulk', 'parallel'):
+                    options.append(word)
+                else:
+                    print("Invalid Input: Use run [bulk] [parallel] [--profile <file>] [--trace <file>]")
+                    return
+
             if not os.path.exists(self.csv_file):
                 print(f'File "{self.csv_file}" does not exist. Run command "test" to input new testcase')
                 return
 
+            trace_path = paths.get('--trace')
+            if trace_path:
+                self.stats.start_trace()
+            if '--profile' in paths:
+                profiler = cProfile.Profile()
+                profiler.enable()
+
+            # Parallel mode runs each stretch of consecutive read-only rows on a thread pool
+            if 'parallel' in options:
+                parallel = ParallelReader(self)
+
+            # t, b and l rows bound to fail are answered in memory and never reach the database
+            preflight = Preflight(self)
+
+            # Bulk mode groups consecutive t/b/l rows into batched transactions
+            if 'bulk' in options:
+                BulkLoader(self, reader=parallel, preflight=preflight).load(self.csv_file)
+                return
+
+            reads = []
             with open(self.csv_file, 'r') as file:
                 reader = csv.reader(file)
                 for row in reader:
@@ -655,11 +646,177 @@ class DatabaseCLI(cmd.Cmd):
                     command = row[0].strip()
                     args = " ".join(part.strip() for part in row[1:])
                     full_command = f"{command} {args}"
+
+                    if parallel is not None and command in READ_ONLY_COMMANDS:
+                        reads.append(full_command)
+                        continue
+                    if reads:
+                        parallel.run(reads)
+                        reads = []
+
+                    message = preflight.check(command, args.split())
+                    if message is not None:
+                        with self.stats.command(command):
+                            print(message)
+                        continue
                     self.onecmd(full_command)
+
+            if reads:
+                parallel.run(reads)
         
         except Exception as e:
             print(f"Error running commands from file: {e}")
 
+        finally:
+            if parallel is not None:
+                parallel.close()
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(paths['--profile'])
+                print(f"Profile written to {paths['--profile']}")
+            if trace_path:
+                self.stats.write_trace(trace_path)
+                print(f"Trace written to {trace_path}")
+
+
+
+    # Function to choose how F finds trips
+    def do_engine(self, arg):
+        'Selects the trip planner used by F (sql queries or in-memory timetable): engine <sql|memory>'
+
+        engine = arg.strip()
+        if not engine:
+            print(f"Current engine: {self.engine}")
+            return
+        if engine not in ('sql', 'memory'):
+            print("Invalid Input: The engine must be either sql or memory")
+            return
+
+        self.engine = engine
+        self.timetable = None
+        print(f"F will use the {engine} engine")
+
+
+
+    # Function to inspect the result cache
+    def do_cache(self, arg):
+        'Shows result cache counters for T, B, C and F, or empties the cache: cache [clear]'
+
+        if arg.strip() == 'clear':
+            self.cache.clear()
+            print("Cache cleared")
+            return
+        if arg.strip():
+            print("Invalid Input: Use cache or cache clear")
+            return
+
+        stats = self.cache.stats()
+        print(" ".join(f"{name} {value}" for name, value in stats.items()))
+
+
+
+    # Function to save or restore all three tables at once
+    def do_snapshot(self, arg):
+        'Saves the tables to a binary snapshot, or restores one and replays the change log written after it: snapshot <save|load> <file>'
+
+        try:
+            arguments = arg.split()
+            if len(arguments) != 2 or arguments[0] not in ('save', 'load'):
+                print("Invalid Input: Use snapshot save <file> or snapshot load <file>")
+                return
+
+            action, path = arguments
+            if action == 'save':
+                terminals, routes, departures = self.backend.dump()
+                position = self.change_log.count if self.change_log is not None else 0
+                save_snapshot(path, terminals, routes, departures, position)
+                print(f"Snapshot saved: {len(terminals)} terminals, {len(routes)} routes, {len(departures)} departures")
+                return
+
+            # The clear and every insert are one transaction, so a failure leaves the old tables in place
+            position, terminals, routes, departures = load_snapshot(path)
+            try:
+                self.backend.replace_tables(terminals, routes, departures)
+            finally:
+                self.timetable = None
+                self.conflicts = None
+                self.connection_index = None
+                self.matrix = None
+                self.cache.clear()
+
+            # Changes logged after the snapshot was saved bring it up to date; they are already in the log
+            replayed = 0
+            if self.change_log is not None:
+                tail = self.change_log.tail(position)
+                changes = self.changes
+                self.change_log.paused = True
+                try:
+                    BulkLoader(self).load_rows(tail)
+                finally:
+                    self.change_log.paused = False
+                replayed = self.changes - changes
+
+            print(f"Snapshot loaded: {len(terminals)} terminals, {len(routes)} routes, {len(departures)} departures, "
+                  f"{replayed} logged changes replayed")
+
+        except Exception as e:
+            print(f"Error: {e}")
+
+
+
+    # Function to publish a new timetable by changing only the rows that differ
+    def do_sync(self, arg):
+        'Makes the tables match a command file, applying only the differences in one transaction: sync <csv file>'
+
+        try:
+            path = arg.strip()
+            if not path:
+                print("Invalid Input: Use sync <csv file>")
+                return
+            if not os.path.exists(path):
+                path = os.path.join('testcase', path)
+            if not os.path.exists(path):
+                print(f'File "{arg.strip()}" does not exist')
+                return
+
+            # The file is read as r followed by run would store it, then compared route by route
+            key = self.backend.name_key
+            diff = diff_timetable(self.backend.dump(), read_timetable(path, key), key)
+            if not diff:
+                print("Already in sync")
+                return
+
+            self.backend.apply_delta(diff)
+            self.timetable = None
+            self.conflicts = None
+            self.connection_index = None
+            self.matrix = None
+            self.cache.clear()
+            self.changes += 1
+            if self.change_log is not None:
+                self.change_log.append(['sync', self.change_log.keep(path)])
+            print(f"Synced: {diff.summary()}")
+
+        except Exception as e:
+            print(f"Error: {e}")
+
+
+
+    # Function to show where time goes per command
+    def do_stats(self, arg):
+        'Shows wall, database and Python time, rows fetched and round trips per command, or clears them: stats [reset]'
+
+        if arg.strip() == 'reset':
+            self.stats.reset()
+            print("Stats cleared")
+            return
+        if arg.strip():
+            print("Invalid Input: Use stats or stats reset")
+            return
+
+        for line in self.stats.report():
+            print(line)
+
 
 
     # Function to reset testfile to be ran
@@ -678,13 +835,43 @@ class DatabaseCLI(cmd.Cmd):
         'Exits the CLI: exit'
         
         print("Exiting...")
-        self.connection.close()
+        self.close()
         return True
 
 
+
+    # Releases the backend connection and the change log
+    def close(self):
+        self.backend.close()
+        if self.change_log is not None:
+            self.change_log.close()
+
+
 if __name__ == '__main__':
-    data_input = str(input("Please enter the name of the file you would like to use (include .csv): "))
-    csv_file = data_input
-    print("Your test file to be used is: " + csv_file)
+    parser = argparse.ArgumentParser(description='Bus Routes Database CLI')
+    parser.add_argument('csv_file', nargs='?', help='command file inside testcase/ (asked for when not given)')
+    parser.add_argument('-c', '--command', action='append', dest='commands', metavar='COMMAND',
+                        help='run this command instead of starting the prompt; repeat to run several in order')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='mysql', help='storage backend (default: mysql)')
+    parser.add_argument('--sqlite-path', default='busroute.db', help='database file for the sqlite backend')
+    parser.add_argument('--change-log', metavar='FILE', help='append every successful t, b, l and r to this file')
+    options = parser.parse_args()
+
+    # The file is only asked for when starting the prompt without one
+    csv_file = options.csv_file or ''
+    if options.csv_file is None and not options.commands:
+        data_input = str(input("Please enter the name of the file you would like to use (include .csv): "))
+        csv_file = data_input
+        print("Your test file to be used is: " + csv_file)
     
-    DatabaseCLI(csv_file).cmdloop()
+    change_log = ChangeLog(options.change_log) if options.change_log else None
+    cli = DatabaseCLI(csv_file, create_backend(options.backend, options.sqlite_path), change_log=change_log)
+
+    # One-shot mode: run the given commands and exit without a prompt
+    if options.commands:
+        for command in options.commands:
+            cli.onecmd(command)
+        cli.close()
+        sys.exit(0)
+
+    cli.cmdloop()
@@ -0,0 +1,919 @@
+import sqlite3
+import threading
+import time
+from decimal import Decimal, ROUND_HALF_UP
+from conflicts import HEADWAY_MINUTES
+from schema import migrate
+from timetable import Timetable
+
+
+TABLES = ('Terminal', 'Route', 'LeaveTime')
+
+# Rows per executemany call, so no batch outgrows MySQL's max_allowed_packet
+BATCH_SIZE = 1000
+CENT = Decimal('0.01')
+
+# Times a locked write transaction is run again after a deadlock or lock wait timeout, and the first pause
+LOCK_RETRIES = 5
+LOCK_RETRY_SECONDS = 0.05
+
+
+class BackendError(Exception):
+    """Raised when a backend rejects a change, like MySQL does for key and check violations."""
+
+
+# Storage fares the way a DECIMAL(5,2) column does
+def to_fare(value):
+    fare = Decimal(repr(value) if isinstance(value, float) else str(value)).quantize(CENT, rounding=ROUND_HALF_UP)
+    if fare <= 0 or fare >= 1000:
+        raise BackendError(f"Fare {value} out of range")
+    return fare
+
+
+class Backend:
+    """Storage operations used by the DatabaseCLI commands.
+
+    Departure times are passed as integer minutes since midnight and fares as Decimal, so
+    every backend produces the same command output. Each change commits on its own and
+    raises on invalid data, leaving the stored data untouched.
+    """
+
+    name = None
+
+    # Set once ensure_schema has checked the tables, so later e commands skip the probe
+    schema_verified = False
+
+    def ensure_schema(self):
+        """Creates missing tables, returns the names of the tables created."""
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    def add_terminal(self, name, district):
+        raise NotImplementedError
+
+    def add_route(self, route_num, source, destination, travel_time, fare):
+        raise NotImplementedError
+
+    def add_departure(self, route_num, minutes):
+        """Adds a departure unless it is within the headway of another on the route, safe against concurrent writers."""
+        raise NotImplementedError
+
+    def add_many(self, command, rows):
+        """Adds a batch of t, b or l rows in one transaction, all or nothing."""
+        raise NotImplementedError
+
+    def apply_delta(self, diff):
+        """Applies a sync.TimetableDiff in one transaction, all or nothing."""
+        raise NotImplementedError
+
+    def replace_tables(self, terminals, routes, departures):
+        """Clears the tables and fills them with the given rows in one transaction, all or nothing."""
+        raise NotImplementedError
+
+    def terminal(self, name):
+        """Returns (Name, District) or None."""
+        raise NotImplementedError
+
+    def terminal_routes(self, name):
+        """Returns the route numbers leaving from and arriving at a terminal, each sorted."""
+        raise NotImplementedError
+
+    def route(self, route_num):
+        """Returns (RouteNum, Source, Destination, TravelTime, Fare) or None."""
+        raise NotImplementedError
+
+    def departures(self, route_num):
+        """Returns the departure minutes of a route in ascending order."""
+        raise NotImplementedError
+
+    # How the database compares terminal names; MySQL's default collation ignores case
+    @staticmethod
+    def name_key(name):
+        return name
+
+    def terminal_details(self, names):
+        """Returns, for each name in order, (Name, District, source routes, destination routes) or None."""
+        details = []
+        for name in names:
+            row = self.terminal(name)
+            details.append(None if row is None else tuple(row) + self.terminal_routes(name))
+        return details
+
+    def route_details(self, route_nums):
+        """Returns, for each route number in order, (route row, sorted departure minutes) or None."""
+        details = []
+        for route_num in route_nums:
+            row = self.route(route_num)
+            details.append(None if row is None else (tuple(row), self.departures(route_num)))
+        return details
+
+    def district_counts(self):
+        """Returns (District, routes leaving, routes arriving) ordered by the first terminal name in each district."""
+        raise NotImplementedError
+
+    def adjacent_terminals(self, source, destination):
+        """Returns the terminals one route away from source (outbound) or destination (inbound)."""
+        raise NotImplementedError
+
+    def trip_streams(self, source, destination, start_total_minutes, end_total_minutes, limit=None):
+        """Returns the direct, one-transfer and two-transfer F results as three iterables, each in trip_order.
+
+        With a limit each iterable holds at most that many results.
+        """
+        raise NotImplementedError
+
+    def dump(self):
+        """Returns every terminal, route and departure row, for in-memory indexes."""
+        raise NotImplementedError
+
+    def worker(self):
+        """Returns a backend another thread can read through concurrently, or None if not supported."""
+        return None
+
+    def close(self):
+        pass
+
+
+# Queries shared by the SQL backends, written with %s placeholders.
+# The F queries are ordered by F's print order (total travel time, then last route) so they can be merged as streams.
+DIRECT_TRIPS = """
+    SELECT R.RouteNum, R.Fare, R.TravelTime, L.LeaveMinutes
+    FROM Route R
+    JOIN LeaveTime L ON R.RouteNum = L.RouteNum
+    WHERE R.Source = %s AND R.Destination = %s
+    AND L.LeaveMinutes >= %s
+    AND L.LeaveMinutes <= %s
+    ORDER BY L.LeaveMinutes + R.TravelTime, R.RouteNum, L.LeaveMinutes ASC
+"""
+
+ONE_TRANSFER_TRIPS = """
+    SELECT R1.RouteNum AS first_route, R1.Fare AS fare1, R1.TravelTime AS travel_time1, L1.LeaveMinutes AS leave_time1,
+        R2.RouteNum AS second_route, R2.Fare AS fare2, R2.TravelTime AS travel_time2, L2.LeaveMinutes AS leave_time2
+    FROM Route R1
+    JOIN LeaveTime L1 ON R1.RouteNum = L1.RouteNum
+    JOIN Route R2 ON R1.Destination = R2.Source
+    JOIN LeaveTime L2 ON R2.RouteNum = L2.RouteNum
+    WHERE R1.Source = %s AND R2.Destination = %s
+    AND L1.LeaveMinutes >= %s
+    AND L1.LeaveMinutes <= %s
+    AND L2.LeaveMinutes >= L1.LeaveMinutes + 5
+    ORDER BY L2.LeaveMinutes + R2.TravelTime - L1.LeaveMinutes - R1.TravelTime, R2.RouteNum, leave_time1, leave_time2 ASC
+"""
+
+TWO_TRANSFER_TRIPS = """
+    SELECT R1.RouteNum AS first_route, R1.Fare AS fare1, R1.TravelTime AS travel_time1, L1.LeaveMinutes AS leave_time1,
+        R2.RouteNum AS second_route, R2.Fare AS fare2, R2.TravelTime AS travel_time2, L2.LeaveMinutes AS leave_time2,
+        R3.RouteNum AS third_route, R3.Fare AS fare3, R3.TravelTime AS travel_time3, L3.LeaveMinutes AS leave_time3
+    FROM Route R1
+    JOIN LeaveTime L1 ON R1.RouteNum = L1.RouteNum
+    JOIN Route R2 ON R1.Destination = R2.Source
+    JOIN LeaveTime L2 ON R2.RouteNum = L2.RouteNum
+    JOIN Route R3 ON R2.Destination = R3.Source
+    JOIN LeaveTime L3 ON R3.RouteNum = L3.RouteNum
+    WHERE R1.Source = %s AND R3.Destination = %s
+    AND L1.LeaveMinutes >= %s
+    AND L1.LeaveMinutes <= %s
+    AND L2.LeaveMinutes >= L1.LeaveMinutes + 5
+    AND L3.LeaveMinutes >= L2.LeaveMinutes + 5
+    ORDER BY L2.LeaveMinutes + R2.TravelTime + R3.TravelTime, R3.RouteNum, leave_time1, leave_time2, leave_time3 ASC
+"""
+
+# Districts come out in the order the original SELECT DISTINCT District met them scanning Terminal
+# by its Name primary key: by the first terminal name in each district
+DISTRICT_COUNTS = """
+    SELECT T.District,
+        COALESCE(SUM(Uses.IsSource), 0) AS SourceCount,
+        COALESCE(SUM(Uses.IsDestination), 0) AS DestinationCount
+    FROM Terminal T
+    LEFT JOIN (
+        SELECT Source AS Name, 1 AS IsSource, 0 AS IsDestination FROM Route
+        UNION ALL
+        SELECT Destination AS Name, 0 AS IsSource, 1 AS IsDestination FROM Route
+    ) Uses ON Uses.Name = T.Name
+    GROUP BY T.District
+    ORDER BY MIN(T.Name)
+"""
+
+INSERTS = {
+    't': "INSERT INTO Terminal (Name, District) VALUES (%s, %s)",
+    'b': "INSERT INTO Route (RouteNum, Source, Destination, TravelTime, Fare) VALUES (%s, %s, %s, %s, %s)",
+    'l': "INSERT INTO LeaveTime (RouteNum, LeaveMinutes) VALUES (%s, %s)",
+}
+
+
+class SQLBackend(Backend):
+    """Backend over a DB-API connection. Subclasses provide query, execute_many, commit and rollback."""
+
+    inserts = INSERTS
+
+    # Appended to the reads that guard a departure insert, so they lock and see the latest rows
+    for_update = " FOR UPDATE"
+
+    def query(self, sql, params=()):
+        raise NotImplementedError
+
+    def execute_many(self, sql, rows):
+        raise NotImplementedError
+
+    def commit(self):
+        raise NotImplementedError
+
+    def rollback(self):
+        raise NotImplementedError
+
+    def change(self, sql, params):
+        try:
+            self.query(sql, params)
+            self.commit()
+        except Exception as e:
+            self.rollback()
+            raise BackendError(str(e)) from e
+
+    def clear(self):
+        # Clear data with DELETE, which respects foreign key constraints
+        try:
+            self.query("DELETE FROM LeaveTime")
+            self.query("DELETE FROM Route")
+            self.query("DELETE FROM Terminal")
+            self.commit()
+        except Exception:
+            self.rollback()
+            raise
+
+    def add_terminal(self, name, district):
+        self.change(self.inserts['t'], (name, district))
+
+    def add_route(self, route_num, source, destination, travel_time, fare):
+        self.change(self.inserts['b'], (route_num, source, destination, travel_time, fare))
+
+    # Starts the transaction a departure insert runs in; the row locks are taken by its reads
+    def begin(self):
+        pass
+
+    # True for a failure that says nothing about the rows, only that another writer held a lock:
+    # MySQL's deadlock (1213) and lock wait timeout (1205)
+    def lock_conflict(self, error):
+        return getattr(error, 'errno', None) in (1205, 1213)
+
+    # Runs a write transaction, running it again from the start while it loses to another writer's
+    # locks, up to LOCK_RETRIES times; any other failure is raised as a BackendError at once
+    def locked_write(self, transaction):
+        for attempt in range(LOCK_RETRIES + 1):
+            try:
+                self.begin()
+                transaction()
+                self.commit()
+                return
+            except Exception as e:
+                self.rollback()
+                if attempt == LOCK_RETRIES or not self.lock_conflict(e):
+                    raise BackendError(str(e)) from e
+            time.sleep(LOCK_RETRY_SECONDS * 2 ** attempt)
+
+    def add_departure(self, route_num, minutes):
+        # Locking the route row makes writers to one route take turns between the check and the insert.
+        # Two routes leaving at the same minute are stopped by the unique index on LeaveMinutes.
+        def insert():
+            if not self.query("SELECT RouteNum FROM Route WHERE RouteNum = %s" + self.for_update, (route_num,)):
+                raise BackendError(f"Route {route_num} does not exist")
+            if self.query(
+                "SELECT LeaveMinutes FROM LeaveTime WHERE RouteNum = %s AND LeaveMinutes BETWEEN %s AND %s" + self.for_update,
+                (route_num, minutes - HEADWAY_MINUTES, minutes + HEADWAY_MINUTES),
+            ):
+                raise BackendError(f"Departure {route_num} {minutes} is within {HEADWAY_MINUTES} minutes of another")
+            self.query(self.inserts['l'], (route_num, minutes))
+
+        self.locked_write(insert)
+
+    def add_many(self, command, rows):
+        def insert():
+            if command == 'l':
+                self.lock_departures(rows)
+            self.execute_many(self.inserts[command], rows)
+
+        self.locked_write(insert)
+
+    # The batch form of add_departure's check: locks each route of the batch, in route order so
+    # two batches cannot deadlock, and raises if a new departure is within the headway of another
+    def lock_departures(self, rows):
+        new_times = {}
+        for route_num, minutes in rows:
+            new_times.setdefault(route_num, []).append(minutes)
+        for route_num in sorted(new_times):
+            if not self.query("SELECT RouteNum FROM Route WHERE RouteNum = %s" + self.for_update, (route_num,)):
+                raise BackendError(f"Route {route_num} does not exist")
+            stored = self.query("SELECT LeaveMinutes FROM LeaveTime WHERE RouteNum = %s" + self.for_update, (route_num,))
+            times = sorted([(row[0], False) for row in stored] + [(minutes, True) for minutes in new_times[route_num]])
+            for (earlier, earlier_new), (later, later_new) in zip(times, times[1:]):
+                if (earlier_new or later_new) and later - earlier <= HEADWAY_MINUTES:
+                    raise BackendError(f"Departure {route_num} {later} is within {HEADWAY_MINUTES} minutes of another")
+
+    # One batch per kind of change, ordered so foreign keys and the unique minute hold after each
+    def delta_steps(self):
+        return [
+            ('departures_removed', "DELETE FROM LeaveTime WHERE RouteNum = %s AND LeaveMinutes = %s"),
+            ('terminals_added', self.inserts['t']),
+            ('terminals_changed', "UPDATE Terminal SET District = %s WHERE Name = %s"),
+            ('routes_changed', "UPDATE Route SET Source = %s, Destination = %s, TravelTime = %s, Fare = %s WHERE RouteNum = %s"),
+            ('routes_added', self.inserts['b']),
+            ('routes_removed', "DELETE FROM Route WHERE RouteNum = %s"),
+            ('terminals_removed', "DELETE FROM Terminal WHERE Name = %s"),
+            ('departures_added', self.inserts['l']),
+        ]
+
+    def apply_delta(self, diff):
+        def apply():
+            for step, sql in self.delta_steps():
+                if step == 'departures_added':
+                    self.lock_departures(diff.departures_added)
+                self.execute_batches(sql, getattr(diff, step))
+
+        self.locked_write(apply)
+
+    def execute_batches(self, sql, rows):
+        for start in range(0, len(rows), BATCH_SIZE):
+            self.execute_many(sql, rows[start:start + BATCH_SIZE])
+
+    def replace_tables(self, terminals, routes, departures):
+        try:
+            self.begin()
+            self.query("DELETE FROM LeaveTime")
+            self.query("DELETE FROM Route")
+            self.query("DELETE FROM Terminal")
+            for command, rows in (('t', terminals), ('b', routes), ('l', departures)):
+                self.execute_batches(self.inserts[command], list(rows))
+            self.commit()
+        except Exception as e:
+            self.rollback()
+            raise BackendError(str(e)) from e
+
+    def terminal(self, name):
+        rows = self.query("SELECT Name, District FROM Terminal WHERE Name = %s", (name,))
+        return tuple(rows[0]) if rows else None
+
+    def terminal_routes(self, name):
+        source_routes = self.query("SELECT RouteNum FROM Route WHERE Source = %s ORDER BY RouteNum ASC", (name,))
+        destination_routes = self.query("SELECT RouteNum FROM Route WHERE Destination = %s ORDER BY RouteNum ASC", (name,))
+        return [row[0] for row in source_routes], [row[0] for row in destination_routes]
+
+    def route(self, route_num):
+        rows = self.query("""
+            SELECT RouteNum, Source, Destination, TravelTime, Fare
+            FROM Route
+            WHERE RouteNum = %s
+        """, (route_num,))
+        return tuple(rows[0]) if rows else None
+
+    def departures(self, route_num):
+        rows = self.query("SELECT LeaveMinutes FROM LeaveTime WHERE RouteNum = %s ORDER BY LeaveMinutes ASC", (route_num,))
+        return [row[0] for row in rows]
+
+    def terminal_details(self, names):
+        # The terminal rows and the routes leaving and reaching them, in one round trip
+        placeholders = ", ".join(["%s"] * len(names))
+        rows = self.query(f"""
+            SELECT Name, District, 0, NULL FROM Terminal WHERE Name IN ({placeholders})
+            UNION ALL
+            SELECT Source, NULL, 1, RouteNum FROM Route WHERE Source IN ({placeholders})
+            UNION ALL
+            SELECT Destination, NULL, 2, RouteNum FROM Route WHERE Destination IN ({placeholders})
+        """, tuple(names) * 3)
+
+        found = {}
+        for name, district, kind, route_num in rows:
+            if kind == 0:
+                found.setdefault(self.name_key(name), [name, district, [], []])[:2] = [name, district]
+            else:
+                found.setdefault(self.name_key(name), [None, None, [], []])[1 + kind].append(route_num)
+
+        details = []
+        for name in names:
+            entry = found.get(self.name_key(name))
+            details.append(None if entry is None or entry[0] is None else (entry[0], entry[1], sorted(entry[2]), sorted(entry[3])))
+        return details
+
+    def route_details(self, route_nums):
+        # Route rows joined to their departures, in one round trip; only numeric ids can match a route
+        numbers = {route_num: int(route_num) for route_num in route_nums if str(route_num).lstrip('-').isdigit()}
+        found = {}
+        if numbers:
+            placeholders = ", ".join(["%s"] * len(set(numbers.values())))
+            rows = self.query(f"""
+                SELECT R.RouteNum, R.Source, R.Destination, R.TravelTime, R.Fare, L.LeaveMinutes
+                FROM Route R
+                LEFT JOIN LeaveTime L ON L.RouteNum = R.RouteNum
+                WHERE R.RouteNum IN ({placeholders})
+                ORDER BY R.RouteNum, L.LeaveMinutes
+            """, tuple(set(numbers.values())))
+            for route_num, source, destination, travel_time, fare, minutes in rows:
+                entry = found.setdefault(route_num, ((route_num, source, destination, travel_time, fare), []))
+                if minutes is not None:
+                    entry[1].append(minutes)
+        return [found.get(numbers.get(route_num)) for route_num in route_nums]
+
+    def district_counts(self):
+        return [(district, int(sources), int(destinations)) for district, sources, destinations in self.query(DISTRICT_COUNTS)]
+
+    def adjacent_terminals(self, source, destination):
+        rows = self.query("""
+            SELECT Destination FROM Route WHERE Source = %s
+            UNION
+            SELECT Source FROM Route WHERE Destination = %s
+        """, (source, destination))
+        return {row[0] for row in rows}
+
+    # Yields the rows of a query; backends that can, read them without holding the whole result
+    def stream(self, sql, params=()):
+        return iter(self.query(sql, params))
+
+    def trip_streams(self, source, destination, start_total_minutes, end_total_minutes, limit=None):
+        params = (source, destination, start_total_minutes, end_total_minutes)
+        suffix = ""
+        if limit is not None:
+            suffix = " LIMIT %s"
+            params += (limit,)
+        return [
+            self._direct_trips(self.stream(DIRECT_TRIPS + suffix, params), start_total_minutes),
+            self._one_transfer_trips(self.stream(ONE_TRANSFER_TRIPS + suffix, params)),
+            self._two_transfer_trips(self.stream(TWO_TRANSFER_TRIPS + suffix, params), start_total_minutes),
+        ]
+
+    @staticmethod
+    def _direct_trips(rows, start_total_minutes):
+        for route_num, fare, travel_time, leave_time_minutes in rows:
+            arrival_time_minutes = leave_time_minutes + travel_time
+            yield (route_num, fare, arrival_time_minutes - start_total_minutes)
+
+    @staticmethod
+    def _one_transfer_trips(rows):
+        for first_route, fare1, travel_time1, leave_time1, second_route, fare2, travel_time2, leave_time2 in rows:
+            arrival_time_first_leg = leave_time1 + travel_time1
+            total_travel_time = (leave_time2 - arrival_time_first_leg + 20) + travel_time2  # Including travel time and waiting
+            yield (first_route, second_route, fare1 + fare2, total_travel_time)
+
+    @staticmethod
+    def _two_transfer_trips(rows, start_total_minutes):
+        for row in rows:
+            first_route, fare1, travel_time1, leave_time1, second_route, fare2, travel_time2, leave_time2, third_route, fare3, travel_time3, leave_time3 = row
+            arrival_time_second_leg = leave_time2 + travel_time2
+            total_travel_time = (arrival_time_second_leg - start_total_minutes + 20) + travel_time3
+            yield (first_route, second_route, third_route, fare1 + fare2 + fare3, total_travel_time)
+
+    def dump(self):
+        terminals = self.query("SELECT Name, District FROM Terminal")
+        routes = self.query("SELECT RouteNum, Source, Destination, TravelTime, Fare FROM Route")
+        departures = self.query("SELECT RouteNum, LeaveMinutes FROM LeaveTime")
+        return terminals, routes, departures
+
+
+class MySQLBackend(SQLBackend):
+    """The MySQL server the CLI was written for, through the pooled Database layer."""
+
+    name = 'mysql'
+
+    # LeaveTime stores a TIME; LeaveMinutes is generated from it
+    inserts = dict(INSERTS, l="INSERT INTO LeaveTime (RouteNum, LeaveTime) VALUES (%s, SEC_TO_TIME(%s * 60))")
+
+    def __init__(self, db=None):
+        self._db = db
+
+    # Created on first use, so commands that never touch the database never wait for MySQL
+    @property
+    def db(self):
+        if self._db is None:
+            # Imported here so the other backends work without mysql-connector installed
+            from database import Database
+            self._db = Database()
+        return self._db
+
+    # Workers take their own connection from the same pool
+    def worker(self):
+        return MySQLBackend(self.db.worker())
+
+    def stream(self, sql, params=()):
+        return self.db.stream(sql, params)
+
+    def query(self, sql, params=()):
+        return self.db.query(sql, params)
+
+    def execute_many(self, sql, rows):
+        with self.db.cursor() as cursor:
+            cursor.executemany(sql, rows)
+
+    @staticmethod
+    def name_key(name):
+        return name.lower()
+
+    def commit(self):
+        self.db.commit()
+
+    def rollback(self):
+        self.db.rollback()
+
+    # The tables as first created; schema.MIGRATIONS adds indexes and LeaveMinutes on top
+    SCHEMA = {
+        'Terminal': """
+            CREATE TABLE Terminal (
+                Name VARCHAR(255) PRIMARY KEY,
+                District VARCHAR(255)
+            )
+        """,
+        'Route': """
+            CREATE TABLE Route (
+                RouteNum INT PRIMARY KEY,
+                Source VARCHAR(255),
+                Destination VARCHAR(255),
+                TravelTime INT CHECK (TravelTime > 0),
+                Fare DECIMAL(5,2) CHECK (Fare > 0),
+                FOREIGN KEY (Source) REFERENCES Terminal(Name),
+                FOREIGN KEY (Destination) REFERENCES Terminal(Name)
+            )
+        """,
+        'LeaveTime': """
+            CREATE TABLE LeaveTime (
+                RouteNum INT,
+                LeaveTime TIME,
+                PRIMARY KEY(RouteNum, LeaveTime),
+                FOREIGN KEY (RouteNum) REFERENCES Route(RouteNum)
+            )
+        """,
+    }
+
+    def ensure_schema(self):
+        # information_schema is probed once per process
+        if self.schema_verified:
+            return []
+
+        created = []
+        with self.db.cursor() as cursor:
+            cursor.execute("""
+                SELECT table_name
+                FROM information_schema.tables
+                WHERE table_schema = %s
+                AND table_name IN ('Terminal', 'Route', 'LeaveTime')
+            """, (self.db.db_name,))
+            existing_tables = {row[0] for row in cursor.fetchall()}
+
+            # Create the tables that don't exist, in foreign key order
+            for table in TABLES:
+                if table not in existing_tables:
+                    cursor.execute(self.SCHEMA[table])
+                    created.append(table)
+
+            # Bring indexes and derived columns up to the current schema version
+            migrate(cursor)
+        self.db.commit()
+        self.schema_verified = True
+        return created
+
+    def close(self):
+        if self._db is not None:
+            self._db.close()
+
+
+# SQLite hands DECIMAL columns back as floats; convert them the way MySQL returns them
+sqlite3.register_adapter(Decimal, str)
+sqlite3.register_converter("DECIMAL", lambda value: Decimal(value.decode()).quantize(CENT, rounding=ROUND_HALF_UP))
+
+
+class SQLiteBackend(SQLBackend):
+    """Local SQLite file (or :memory:) with the same tables, created at the current schema version."""
+
+    name = 'sqlite'
+
+    SCHEMA = {
+        'Terminal': """
+            CREATE TABLE Terminal (
+                Name VARCHAR(255) PRIMARY KEY,
+                District VARCHAR(255)
+            )
+        """,
+        'Route': """
+            CREATE TABLE Route (
+                RouteNum INTEGER PRIMARY KEY,
+                Source VARCHAR(255) NOT NULL REFERENCES Terminal(Name),
+                Destination VARCHAR(255) NOT NULL REFERENCES Terminal(Name),
+                TravelTime INTEGER CHECK (TravelTime > 0),
+                Fare DECIMAL(5,2) CHECK (Fare > 0 AND Fare < 1000)
+            )
+        """,
+        'LeaveTime': """
+            CREATE TABLE LeaveTime (
+                RouteNum INTEGER NOT NULL REFERENCES Route(RouteNum),
+                LeaveMinutes INTEGER NOT NULL,
+                PRIMARY KEY (RouteNum, LeaveMinutes)
+            )
+        """,
+    }
+
+    INDEXES = [
+        "CREATE INDEX IF NOT EXISTS idx_terminal_district_name ON Terminal (District, Name)",
+        "CREATE INDEX IF NOT EXISTS idx_route_source_destination ON Route (Source, Destination)",
+        "CREATE INDEX IF NOT EXISTS idx_route_destination_source ON Route (Destination, Source)",
+        "CREATE INDEX IF NOT EXISTS idx_leavetime_minutes_route ON LeaveTime (LeaveMinutes, RouteNum)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS idx_leavetime_minutes_unique ON LeaveTime (LeaveMinutes)",
+    ]
+
+    # Run before the unique minute index on a database made before it: departures that share a minute
+    # with a lower-numbered route are moved aside to LeaveTimeConflict, so nothing is lost
+    DUPLICATE_MINUTES = """
+        FROM LeaveTime WHERE EXISTS (
+            SELECT 1 FROM LeaveTime Other
+            WHERE Other.LeaveMinutes = LeaveTime.LeaveMinutes AND Other.RouteNum < LeaveTime.RouteNum
+        )
+    """
+    CLEANUP = [
+        """
+        CREATE TABLE IF NOT EXISTS LeaveTimeConflict (
+            RouteNum INTEGER NOT NULL,
+            LeaveMinutes INTEGER NOT NULL,
+            PRIMARY KEY (RouteNum, LeaveMinutes)
+        )
+        """,
+        "INSERT OR IGNORE INTO LeaveTimeConflict (RouteNum, LeaveMinutes) SELECT RouteNum, LeaveMinutes" + DUPLICATE_MINUTES,
+        "DELETE" + DUPLICATE_MINUTES,
+    ]
+
+    # SQLite has no row locks; BEGIN IMMEDIATE takes the database write lock before the checks instead
+    for_update = ""
+
+    def __init__(self, path='busroute.db'):
+        self.path = path
+        self.connection = sqlite3.connect(path, detect_types=sqlite3.PARSE_DECLTYPES, check_same_thread=False)
+        self.connection.execute("PRAGMA foreign_keys = ON")
+
+    def query(self, sql, params=()):
+        return self.connection.execute(sql.replace('%s', '?'), params).fetchall()
+
+    # SQLite steps a cursor row by row, and several cursors can be open on one connection
+    def stream(self, sql, params=()):
+        return self.connection.execute(sql.replace('%s', '?'), params)
+
+    # A private :memory: database cannot be opened twice
+    def worker(self):
+        if self.path == ':memory:':
+            return None
+        return SQLiteBackend(self.path)
+
+    def execute_many(self, sql, rows):
+        self.connection.executemany(sql.replace('%s', '?'), rows)
+
+    def begin(self):
+        self.connection.execute("BEGIN IMMEDIATE")
+
+    # BEGIN IMMEDIATE gives up with "database is locked" once the busy timeout passes
+    def lock_conflict(self, error):
+        return isinstance(error, sqlite3.OperationalError) and 'locked' in str(error)
+
+    def add_route(self, route_num, source, destination, travel_time, fare):
+        self.change(self.inserts['b'], (route_num, source, destination, travel_time, to_fare(fare)))
+
+    def add_many(self, command, rows):
+        if command == 'b':
+            rows = [(route_num, source, destination, travel_time, to_fare(fare)) for route_num, source, destination, travel_time, fare in rows]
+        super().add_many(command, rows)
+
+    def replace_tables(self, terminals, routes, departures):
+        routes = [(route_num, source, destination, travel_time, to_fare(fare)) for route_num, source, destination, travel_time, fare in routes]
+        super().replace_tables(terminals, routes, departures)
+
+    def commit(self):
+        self.connection.commit()
+
+    def rollback(self):
+        self.connection.rollback()
+
+    def ensure_schema(self):
+        if self.schema_verified:
+            return []
+
+        existing_tables = {row[0] for row in self.query("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        existing_indexes = {row[0] for row in self.query("SELECT name FROM sqlite_master WHERE type = 'index'")}
+        created = []
+        for table in TABLES:
+            if table not in existing_tables:
+                self.connection.execute(self.SCHEMA[table])
+                created.append(table)
+        if 'idx_leavetime_minutes_unique' not in existing_indexes and self.query("SELECT 1" + self.DUPLICATE_MINUTES + " LIMIT 1"):
+            for statement in self.CLEANUP:
+                self.connection.execute(statement)
+        for statement in self.INDEXES:
+            self.connection.execute(statement)
+        self.commit()
+        self.schema_verified = True
+        return created
+
+    def close(self):
+        self.connection.close()
+
+
+class MemoryBackend(Backend):
+    """Pure-Python tables held in dicts, enforcing the same keys and checks as the MySQL schema."""
+
+    name = 'memory'
+
+    def __init__(self):
+        self.tables = set()
+        self.terminals = {}    # Name -> District
+        self.routes = {}       # RouteNum -> (RouteNum, Source, Destination, TravelTime, Fare)
+        self.leave_times = {}  # RouteNum -> set of minutes
+        self.minutes = set()   # minutes some bus leaves at, unique like LeaveMinutes
+        self.timetable = None
+        self.lock = threading.Lock()
+
+    def ensure_schema(self):
+        created = [table for table in TABLES if table not in self.tables]
+        self.tables.update(created)
+        return created
+
+    def clear(self):
+        self.terminals.clear()
+        self.routes.clear()
+        self.leave_times.clear()
+        self.minutes.clear()
+        self.timetable = None
+
+    def add_terminal(self, name, district):
+        if name in self.terminals:
+            raise BackendError(f"Duplicate terminal {name}")
+        self.terminals[name] = district
+        self.timetable = None
+
+    def check_route(self, route_num, source, destination, travel_time, fare):
+        route_num, travel_time = int(route_num), int(travel_time)
+        if route_num in self.routes:
+            raise BackendError(f"Duplicate route {route_num}")
+        if source not in self.terminals or destination not in self.terminals:
+            raise BackendError(f"Route {route_num} refers to an unknown terminal")
+        if travel_time <= 0:
+            raise BackendError(f"Travel time {travel_time} must be positive")
+        return (route_num, source, destination, travel_time, to_fare(fare))
+
+    def add_route(self, route_num, source, destination, travel_time, fare):
+        row = self.check_route(route_num, source, destination, travel_time, fare)
+        self.routes[row[0]] = row
+        self.timetable = None
+
+    def insert_departure(self, route_num, minutes):
+        if route_num not in self.routes:
+            raise BackendError(f"Route {route_num} does not exist")
+        if minutes in self.minutes:
+            raise BackendError(f"Duplicate departure {route_num} {minutes}")
+        self.leave_times.setdefault(route_num, set()).add(minutes)
+        self.minutes.add(minutes)
+        self.timetable = None
+
+    # Callers hold self.lock, so two writers cannot both pass the check before inserting
+    def insert_checked_departure(self, route_num, minutes):
+        if any(abs(time - minutes) <= HEADWAY_MINUTES for time in self.leave_times.get(route_num, ())):
+            raise BackendError(f"Departure {route_num} {minutes} is within {HEADWAY_MINUTES} minutes of another")
+        self.insert_departure(route_num, minutes)
+
+    def add_departure(self, route_num, minutes):
+        with self.lock:
+            self.insert_checked_departure(route_num, minutes)
+
+    # Copies of the tables, so a change that fails part way can put them back
+    def save_tables(self):
+        return dict(self.terminals), dict(self.routes), {route: set(times) for route, times in self.leave_times.items()}, set(self.minutes)
+
+    def restore_tables(self, saved):
+        self.terminals, self.routes, self.leave_times, self.minutes = saved
+        self.timetable = None
+
+    def add_many(self, command, rows):
+        add = {'t': self.add_terminal, 'b': self.add_route, 'l': self.insert_checked_departure}[command]
+        with self.lock:
+            saved = self.save_tables()
+            try:
+                for row in rows:
+                    add(*row)
+            except Exception as e:
+                self.restore_tables(saved)
+                raise BackendError(str(e)) from e
+
+    def replace_tables(self, terminals, routes, departures):
+        saved = self.save_tables()
+        try:
+            self.clear()
+            for command, rows in (('t', terminals), ('b', routes), ('l', departures)):
+                add = {'t': self.add_terminal, 'b': self.add_route, 'l': self.insert_departure}[command]
+                for row in rows:
+                    add(*row)
+        except Exception as e:
+            self.restore_tables(saved)
+            raise BackendError(str(e)) from e
+
+    def apply_delta(self, diff):
+        with self.lock:
+            self._apply_delta(diff)
+
+    def _apply_delta(self, diff):
+        saved = self.save_tables()
+        try:
+            # Same order as the SQL backends, with the same key checks
+            for route_num, minutes in diff.departures_removed:
+                self.leave_times[route_num].remove(minutes)
+                self.minutes.discard(minutes)
+            for name, district in diff.terminals_added:
+                self.add_terminal(name, district)
+            for district, name in diff.terminals_changed:
+                self.terminals[name] = district
+            for source, destination, travel_time, fare, route_num in diff.routes_changed:
+                del self.routes[route_num]
+                self.add_route(route_num, source, destination, travel_time, fare)
+            for row in diff.routes_added:
+                self.add_route(*row)
+            for (route_num,) in diff.routes_removed:
+                if self.leave_times.pop(route_num, None):
+                    raise BackendError(f"Route {route_num} still has departures")
+                del self.routes[route_num]
+            used = {route[1] for route in self.routes.values()} | {route[2] for route in self.routes.values()}
+            for (name,) in diff.terminals_removed:
+                if name in used:
+                    raise BackendError(f"Terminal {name} is still used by a route")
+                del self.terminals[name]
+            for route_num, minutes in diff.departures_added:
+                self.insert_checked_departure(route_num, minutes)
+            self.timetable = None
+        except Exception as e:
+            self.restore_tables(saved)
+            raise BackendError(str(e)) from e
+
+    def terminal(self, name):
+        if name not in self.terminals:
+            return None
+        return (name, self.terminals[name])
+
+    def terminal_routes(self, name):
+        source_routes = sorted(route[0] for route in self.routes.values() if route[1] == name)
+        destination_routes = sorted(route[0] for route in self.routes.values() if route[2] == name)
+        return source_routes, destination_routes
+
+    # One pass over the routes for all the names
+    def terminal_details(self, names):
+        routes = {name: ([], []) for name in names if name in self.terminals}
+        for route_num, source, destination, _, _ in self.routes.values():
+            if source in routes:
+                routes[source][0].append(route_num)
+            if destination in routes:
+                routes[destination][1].append(route_num)
+        return [(name, self.terminals[name], sorted(routes[name][0]), sorted(routes[name][1])) if name in routes else None for name in names]
+
+    def route(self, route_num):
+        try:
+            return self.routes.get(int(route_num))
+        except ValueError:
+            return None
+
+    def departures(self, route_num):
+        try:
+            return sorted(self.leave_times.get(int(route_num), ()))
+        except ValueError:
+            return []
+
+    def district_counts(self):
+        counts = {}
+        for name in sorted(self.terminals):
+            counts.setdefault(self.terminals[name], [0, 0])
+        for _, source, destination, _, _ in self.routes.values():
+            counts[self.terminals[source]][0] += 1
+            counts[self.terminals[destination]][1] += 1
+        return [(district, sources, destinations) for district, (sources, destinations) in counts.items()]
+
+    def adjacent_terminals(self, source, destination):
+        adjacent = {route[2] for route in self.routes.values() if route[1] == source}
+        adjacent.update(route[1] for route in self.routes.values() if route[2] == destination)
+        return adjacent
+
+    def trip_streams(self, source, destination, start_total_minutes, end_total_minutes, limit=None):
+        if self.timetable is None:
+            self.timetable = Timetable(*self.dump())
+        return self.timetable.trip_streams(source, destination, start_total_minutes, limit)
+
+    # Reads only touch dicts that are not changing during a read batch, so threads can share them
+    def worker(self):
+        return self
+
+    def dump(self):
+        terminals = list(self.terminals.items())
+        routes = list(self.routes.values())
+        departures = [(route_num, minutes) for route_num, times in self.leave_times.items() for minutes in times]
+        return terminals, routes, departures
+
+
+BACKENDS = {
+    'mysql': MySQLBackend,
+    'sqlite': SQLiteBackend,
+    'memory': MemoryBackend,
+}
+
+
+def create_backend(name, path=None):
+    """Creates the backend selected on the command line."""
+
+    if name == 'sqlite' and path:
+        return SQLiteBackend(path)
+    return BACKENDS[name]()
@@ -0,0 +1,411 @@
+import argparse
+import bisect
+import contextlib
+import csv
+import io
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from conflicts import FIRST_MINUTE, HEADWAY_MINUTES, LAST_MINUTE
+
+
+# terminals, districts, routes, departures per route, hubs
+SIZES = {
+    'small': (20, 4, 40, 4, 2),
+    'medium': (100, 10, 300, 3, 5),
+    'large': (500, 25, 2000, 2, 10),
+}
+
+
+def hhmm(minutes):
+    return f"{minutes // 60:02d}{minutes % 60:02d}"
+
+
+def generate_network(path, terminals, districts, routes, departures, hubs=0, hub_share=0.5, queries=200, seed=0):
+    """Writes a command CSV: e, the t/b/l rows for a random network, then T/B/C/D/F queries.
+
+    A hub_share fraction of route endpoints is drawn from the first hubs terminals, which gives
+    the few heavily connected terminals of a real network. Returns the number of rows of each kind.
+    """
+
+    rng = random.Random(seed)
+    names = [f"Terminal{index}" for index in range(terminals)]
+    hub_names = names[:hubs]
+
+    def endpoint():
+        if hub_names and rng.random() < hub_share:
+            return rng.choice(hub_names)
+        return rng.choice(names)
+
+    rows = [['e']]
+    for index, name in enumerate(names):
+        rows.append(['t', name, f"District{index % districts}"])
+
+    route_rows = []
+    for route_num in range(1, routes + 1):
+        source = endpoint()
+        destination = endpoint()
+        while destination == source:
+            destination = rng.choice(names)
+        route_rows.append((route_num, source, destination))
+        rows.append(['b', str(route_num), source, destination, str(rng.randint(5, 90)), f"{rng.randint(100, 1000) / 100:.2f}"])
+
+    # Give each route up to the requested departures from the minutes still free. Departures must be
+    # 05:00-23:00, more than HEADWAY_MINUTES apart on a route and unique across routes, so a whole
+    # network holds at most 1,081 departures however many routes it has
+    free_minutes = list(range(FIRST_MINUTE, LAST_MINUTE + 1))
+    rng.shuffle(free_minutes)
+    leave_rows = []
+    for route_num, _, _ in route_rows:
+        times = []
+        for candidate in list(free_minutes):
+            if len(times) == departures:
+                break
+            index = bisect.bisect_left(times, candidate)
+            if index > 0 and candidate - times[index - 1] <= HEADWAY_MINUTES:
+                continue
+            if index < len(times) and times[index] - candidate <= HEADWAY_MINUTES:
+                continue
+            times.insert(index, candidate)
+            free_minutes.remove(candidate)
+        leave_rows.extend((route_num, minutes) for minutes in times)
+    rng.shuffle(leave_rows)
+    rows.extend(['l', str(route_num), hhmm(minutes)] for route_num, minutes in leave_rows)
+
+    for _ in range(queries):
+        source, destination = rng.sample(names, 2)
+        rows.append(['T', rng.choice(names)])
+        rows.append(['B', str(rng.randint(1, routes))])
+        rows.append(['C', source, destination])
+        rows.append(['F', source, destination, hhmm(rng.randint(FIRST_MINUTE, LAST_MINUTE - 60))])
+    rows.extend(['D'] for _ in range(max(1, queries // 20)))
+
+    with open(path, 'w', newline='') as file:
+        csv.writer(file).writerows(rows)
+
+    counts = {}
+    for row in rows:
+        counts[row[0]] = counts.get(row[0], 0) + 1
+    return counts
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def summarize(samples):
+    total = sum(samples)
+    return {
+        'count': len(samples),
+        'p50_ms': round(percentile(samples, 0.50) * 1000, 4),
+        'p99_ms': round(percentile(samples, 0.99) * 1000, 4),
+        'mean_ms': round(statistics.fmean(samples) * 1000, 4),
+        'throughput_per_s': round(len(samples) / total, 1) if total else None,
+    }
+
+
+# Loads a generated file into an empty database, then runs its query commands one at a time.
+# Returns the load time and each command's latencies.
+def run_session(path, directory, backend_name, sqlite_path, bulk):
+    # Imported here so --help works without the CLI's dependencies
+    from BusRoute import DatabaseCLI
+    from backends import create_backend
+
+    if backend_name == 'sqlite' and os.path.exists(sqlite_path):
+        os.remove(sqlite_path)
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        cli = DatabaseCLI(os.path.basename(path), create_backend(backend_name, sqlite_path))
+        cli.csv_file = path
+        cli.onecmd('e')
+        cli.onecmd('r')
+
+        # Load with the run command as a whole, then time each query command on its own
+        with open(path) as file:
+            commands = [row for row in csv.reader(file) if row]
+        load_file = os.path.join(directory, 'load.csv')
+        with open(load_file, 'w', newline='') as file:
+            csv.writer(file).writerows(row for row in commands if row[0] in ('e', 't', 'b', 'l'))
+        cli.csv_file = load_file
+        started = time.perf_counter()
+        cli.onecmd('run bulk' if bulk else 'run')
+        load_seconds = time.perf_counter() - started
+
+        latencies = {}
+        for row in commands:
+            if row[0] in ('e', 't', 'b', 'l'):
+                continue
+            line = f"{row[0]} {' '.join(row[1:])}"
+            started = time.perf_counter()
+            cli.onecmd(line)
+            latencies.setdefault(row[0], []).append(time.perf_counter() - started)
+        cli.backend.close()
+    return load_seconds, latencies
+
+
+def run_size(label, params, backend_name, sqlite_path, queries, seed, bulk):
+    terminals, districts, routes, departures, hubs = params
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f"{label}.csv")
+        counts = generate_network(path, terminals, districts, routes, departures, hubs, queries=queries, seed=seed)
+
+        # tracemalloc slows every allocation, so the timed pass runs without it and a second pass measures peak memory
+        load_seconds, latencies = run_session(path, directory, backend_name, sqlite_path, bulk)
+        tracemalloc.start()
+        run_session(path, directory, backend_name, sqlite_path, bulk)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    load_rows = sum(counts.get(command, 0) for command in ('t', 'b', 'l'))
+    return {
+        'size': label,
+        'terminals': terminals,
+        'districts': districts,
+        'routes': routes,
+        'departures_per_route': departures,
+        'hubs': hubs,
+        'rows': counts,
+        'load': {
+            'mode': 'bulk' if bulk else 'run',
+            'seconds': round(load_seconds, 4),
+            'rows_per_s': round(load_rows / load_seconds, 1) if load_seconds else None,
+        },
+        'commands': {command: summarize(samples) for command, samples in sorted(latencies.items())},
+        'peak_memory_bytes': peak,
+    }
+
+
+def cold_start(backend_name, sqlite_path, runs):
+    """Times fresh CLI processes from launch to exit: help alone, and e then one T query.
+
+    help never touches the database, so it measures interpreter start and imports; the query
+    adds connecting, the schema check and the first round trip.
+    """
+
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'BusRoute.py')
+    base = [sys.executable, script, '--backend', backend_name, '--sqlite-path', os.path.abspath(sqlite_path)]
+    timings = {}
+    for label, commands in (('help', ['help']), ('first_result', ['e', 'T Terminal0'])):
+        samples = []
+        for _ in range(runs):
+            arguments = list(base)
+            for command in commands:
+                arguments += ['-c', command]
+            started = time.perf_counter()
+            subprocess.run(arguments, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=os.path.dirname(script), check=False)
+            samples.append(time.perf_counter() - started)
+        timings[label] = {'median_ms': round(statistics.median(samples) * 1000, 1), 'min_ms': round(min(samples) * 1000, 1)}
+    return timings
+
+
+def _stress_writer(backend_name, sqlite_path, attempts, bulk):
+    # One writer process: its own CLI and connection, sending l for each (route, minutes) attempt,
+    # one command at a time or as a command file loaded with run bulk
+    from BusRoute import DatabaseCLI
+    from backends import create_backend
+
+    with tempfile.TemporaryDirectory() as directory, contextlib.redirect_stdout(io.StringIO()):
+        cli = DatabaseCLI('stress.csv', create_backend(backend_name, sqlite_path))
+        cli.csv_file = os.path.join(directory, 'stress.csv')
+        with open(cli.csv_file, 'w', newline='') as file:
+            csv.writer(file).writerows(['l', route_num, hhmm(minutes)] for route_num, minutes in attempts)
+        started = time.time()
+        if bulk:
+            cli.onecmd('run bulk')
+        else:
+            for route_num, minutes in attempts:
+                cli.onecmd(f"l {route_num} {hhmm(minutes)}")
+        finished = time.time()
+        cli.backend.close()
+    return cli.changes, started, finished
+
+
+def stress(backend_name, sqlite_path, writers, routes, seed, bulk=False):
+    """Sends the same departure attempts from one writer, then split across writer processes.
+
+    Neighbouring attempts are a minute apart on the same route and go to different writers, so
+    they race on the headway check and on the minute. After each run the table must hold no two
+    departures of a route within the headway, no two departures at one minute, and exactly the
+    rows the writers were told went in.
+
+    Whether the writers together beat one writer depends on the backend and the cores: SQLite
+    takes one write lock for the whole database, so there it only checks correctness.
+    """
+
+    from BusRoute import DatabaseCLI
+    from backends import create_backend
+
+    candidates = [(route_num, minutes) for minutes in range(FIRST_MINUTE, LAST_MINUTE + 1) for route_num in range(1, routes + 1)]
+    random.Random(seed).shuffle(candidates)
+    candidates.sort(key=lambda attempt: attempt[1] // 60)
+
+    results = {'backend': backend_name, 'routes': routes, 'attempts': len(candidates), 'bulk': bulk, 'runs': []}
+    for count in sorted({1, writers}):
+        if backend_name == 'sqlite' and os.path.exists(sqlite_path):
+            os.remove(sqlite_path)
+        with contextlib.redirect_stdout(io.StringIO()):
+            cli = DatabaseCLI('stress.csv', create_backend(backend_name, sqlite_path))
+            for command in ['e', 'r', 't StressA DistrictA', 't StressB DistrictB']:
+                cli.onecmd(command)
+            for route_num in range(1, routes + 1):
+                cli.onecmd(f"b {route_num} StressA StressB 30 2.50")
+            cli.backend.close()
+
+        shares = [candidates[index::count] for index in range(count)]
+        with ProcessPoolExecutor(count) as pool:
+            reports = list(pool.map(_stress_writer, [backend_name] * count, [sqlite_path] * count, shares, [bulk] * count))
+        seconds = max(finished for _, _, finished in reports) - min(started for _, started, _ in reports)
+        inserted = sum(rows for rows, _, _ in reports)
+
+        backend = create_backend(backend_name, sqlite_path)
+        terminals, stored_routes, departures = backend.dump()
+        backend.close()
+        times = {}
+        for route_num, minutes in departures:
+            times.setdefault(route_num, []).append(minutes)
+        headway_violations = sum(
+            1 for minutes in times.values() for earlier, later in zip(sorted(minutes), sorted(minutes)[1:])
+            if later - earlier <= HEADWAY_MINUTES
+        )
+        all_minutes = [minutes for _, minutes in departures]
+        results['runs'].append({
+            'writers': count,
+            'seconds': round(seconds, 4),
+            'attempts_per_s': round(len(candidates) / seconds, 1) if seconds else None,
+            'inserted': inserted,
+            'stored': len(departures),
+            'headway_violations': headway_violations,
+            'duplicate_minutes': len(all_minutes) - len(set(all_minutes)),
+            'correct': inserted == len(departures) and not headway_violations and len(all_minutes) == len(set(all_minutes)),
+        })
+    return results
+
+
+def memory_per_departure(rows, routes, seed):
+    """Bytes held per departure for rows as fetchall() tuples, as a dict per row, and in the model.
+
+    The rows are random (route, minutes) pairs, not a valid schedule; only their count matters.
+    Each layout is built from a generator and measured with tracemalloc once built, terminals and
+    routes included, so temporary lists made while building are not counted.
+    """
+
+    from model import Network
+
+    terminals = [(f"Terminal{index}", f"District{index % 10}") for index in range(max(2, routes // 4))]
+    route_rows = [(route_num, terminals[route_num % len(terminals)][0], terminals[(route_num + 1) % len(terminals)][0], 30, '2.50')
+                  for route_num in range(1, routes + 1)]
+
+    def departures():
+        rng = random.Random(seed)
+        for _ in range(rows):
+            yield rng.randint(1, routes), rng.randint(FIRST_MINUTE, LAST_MINUTE)
+
+    layouts = {
+        'tuples': lambda: (terminals, route_rows, list(departures())),
+        'dicts': lambda: (
+            [{'Name': name, 'District': district} for name, district in terminals],
+            [dict(zip(('RouteNum', 'Source', 'Destination', 'TravelTime', 'Fare'), row)) for row in route_rows],
+            [{'RouteNum': route_num, 'LeaveMinutes': minutes} for route_num, minutes in departures()],
+        ),
+        'model': lambda: Network(terminals, route_rows, departures()),
+    }
+
+    results = {'rows': rows, 'routes': routes, 'layouts': {}}
+    for label, build in layouts.items():
+        tracemalloc.start()
+        held = build()
+        current, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        results['layouts'][label] = {
+            'bytes': current,
+            'bytes_per_departure': round(current / rows, 2),
+            'peak_bytes': peak,
+        }
+        del held
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the Bus Routes CLI commands on generated networks')
+    parser.add_argument('--backend', choices=['mysql', 'sqlite', 'memory'], default='memory', help='storage backend (default: memory)')
+    parser.add_argument('--sqlite-path', default='benchmark.db', help='database file for the sqlite backend')
+    parser.add_argument('--sizes', default='small,medium', help=f"comma separated sizes from {', '.join(SIZES)}")
+    parser.add_argument('--queries', type=int, default=200, help='queries of each read command per size')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--bulk', action='store_true', help='load with run bulk instead of run')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--generate', metavar='CSV', help='only write the command CSV for the first size and exit')
+    parser.add_argument('--cold-start-runs', type=int, default=5, help='fresh CLI processes timed for cold start (0 to skip)')
+    parser.add_argument('--stress', type=int, metavar='WRITERS', help='only race l (or run bulk with --bulk) from this many writer processes against one writer and exit')
+    parser.add_argument('--stress-routes', type=int, default=20, help='routes the stress writers add departures to')
+    parser.add_argument('--memory-rows', type=int, metavar='ROWS', help='only measure bytes per departure at this many rows and exit')
+    parser.add_argument('--memory-routes', type=int, default=10000, help='routes the measured departures belong to')
+    options = parser.parse_args(argv)
+
+    if options.memory_rows:
+        results = memory_per_departure(options.memory_rows, options.memory_routes, options.seed)
+        for label, stats in results['layouts'].items():
+            print(f"{label}: {stats['bytes_per_departure']} bytes/departure at {results['rows']} rows "
+                  f"({stats['bytes'] / 1e6:.1f} MB held, peak {stats['peak_bytes'] / 1e6:.1f} MB)")
+        if options.output:
+            with open(options.output, 'w') as file:
+                json.dump(results, file, indent=2)
+        return 0
+
+    if options.stress:
+        # Writer processes need a database they can all open
+        if options.backend == 'memory':
+            parser.error('--stress needs the sqlite or mysql backend')
+        results = stress(options.backend, options.sqlite_path, options.stress, options.stress_routes, options.seed, options.bulk)
+        for run in results['runs']:
+            print(f"{run['writers']} writer(s): {run['attempts_per_s']} l/s over {results['attempts']} attempts, "
+                  f"{run['stored']} stored, {'correct' if run['correct'] else 'INCORRECT'}")
+        if options.output:
+            with open(options.output, 'w') as file:
+                json.dump(results, file, indent=2)
+        return 0
+
+    sizes = [size.strip() for size in options.sizes.split(',') if size.strip()]
+    for size in sizes:
+        if size not in SIZES:
+            parser.error(f"unknown size {size}")
+
+    if options.generate:
+        counts = generate_network(options.generate, *SIZES[sizes[0]], queries=options.queries, seed=options.seed)
+        print(json.dumps(counts))
+        return 0
+
+    results = {
+        'backend': options.backend,
+        'seed': options.seed,
+        'python': sys.version.split()[0],
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'sizes': [run_size(size, SIZES[size], options.backend, options.sqlite_path, options.queries, options.seed, options.bulk) for size in sizes],
+    }
+    if options.cold_start_runs > 0:
+        results['cold_start'] = cold_start(options.backend, options.sqlite_path, options.cold_start_runs)
+
+    for result in results['sizes']:
+        print(f"{result['size']}: load {result['load']['seconds']}s ({result['load']['rows_per_s']} rows/s), "
+              f"peak {result['peak_memory_bytes'] / 1e6:.1f} MB")
+        for command, stats in result['commands'].items():
+            print(f"  {command}: p50 {stats['p50_ms']} ms, p99 {stats['p99_ms']} ms, {stats['throughput_per_s']}/s")
+    for label, stats in results.get('cold_start', {}).items():
+        print(f"cold start {label}: median {stats['median_ms']} ms, min {stats['min_ms']} ms")
+
+    if options.output:
+        with open(options.output, 'w') as file:
+            json.dump(results, file, indent=2)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,146 @@
+import argparse
+import csv
+import sys
+from conflicts import departure_minutes
+from parallel import READ_ONLY_COMMANDS
+
+
+class BulkLoader:
+    """Loads a command CSV with consecutive t/b/l rows grouped into executemany batches.
+
+    Rows are validated in memory first. Rows that would fail validation, read commands and
+    batches rejected by the backend go through DatabaseCLI.onecmd so their output is unchanged.
+    Given a ParallelReader, consecutive read-only rows are run through it as one group instead.
+    Given a Preflight, rows it finds bound to fail print their Invalid Input line in place.
+    """
+
+    def __init__(self, cli, batch_size=1000, reader=None, preflight=None):
+        self.cli = cli
+        self.batch_size = batch_size
+        self.reader = reader
+        self.preflight = preflight
+        self.pending_command = None
+        self.pending = []  # (parameters, full command) for the open batch
+        self.reads = []    # read-only commands waiting for the reader
+
+    # Returns insert parameters for a row that passes the handler checks, or None
+    def validate(self, command, arguments):
+        if command == 't':
+            if len(arguments) == 2:
+                return tuple(arguments)
+
+        elif command == 'b':
+            if len(arguments) == 5:
+                try:
+                    return (int(arguments[0]), arguments[1], arguments[2], int(arguments[3]), float(arguments[4]))
+                except ValueError:
+                    return None
+
+        elif command == 'l':
+            if len(arguments) != 2:
+                return None
+            try:
+                route_number = int(arguments[0])
+            except ValueError:
+                return None
+            departure = departure_minutes(arguments[1])
+            if route_number <= 0 or departure is None:
+                return None
+            # Accepted rows go into the CLI's conflict index so later rows in the file see them
+            conflicts = self.cli.load_conflicts()
+            if conflicts.conflicts(route_number, departure):
+                return None
+            conflicts.add(route_number, departure)
+            return (route_number, departure)
+
+        return None
+
+    # Runs the waiting read-only commands through the parallel reader
+    def flush_reads(self):
+        if self.reads:
+            reads = self.reads
+            self.reads = []
+            self.reader.run(reads)
+
+    # Sends the open batch as one transaction, retrying row by row if the backend rejects it
+    def flush(self):
+        self.flush_reads()
+        if not self.pending:
+            return
+
+        rows = self.pending
+        command = self.pending_command
+        self.pending = []
+        self.pending_command = None
+
+        try:
+            self.cli.backend.add_many(command, [parameters for parameters, _ in rows])
+            for parameters, _ in rows:
+                self.cli.changed(command, parameters)
+        except Exception:
+            self.cli.conflicts = None
+            for _, full_command in rows:
+                self.cli.onecmd(full_command)
+
+    def load(self, csv_file):
+        with open(csv_file, 'r') as file:
+            self.load_rows(csv.reader(file))
+
+    # Runs command rows already split into fields, such as the tail of the change log
+    def load_rows(self, rows):
+        for row in rows:
+            if not row:
+                continue
+
+            command = row[0].strip()
+            args = " ".join(part.strip() for part in row[1:])
+            full_command = f"{command} {args}"
+
+            if self.reader is not None and command in READ_ONLY_COMMANDS:
+                self.flush()
+                self.reads.append(full_command)
+                continue
+
+            if self.preflight is not None:
+                message = self.preflight.check(command, args.split())
+                if message is not None:
+                    self.flush()
+                    with self.cli.stats.command(command):
+                        print(message)
+                    continue
+
+            parameters = self.validate(command, args.split())
+            if parameters is None:
+                # Read commands and invalid rows run through the normal handler, in order
+                self.flush()
+                self.cli.onecmd(full_command)
+                continue
+
+            if command != self.pending_command or len(self.pending) >= self.batch_size:
+                self.flush()
+            self.pending_command = command
+            self.pending.append((parameters, full_command))
+
+        self.flush()
+
+
+# Standalone entry point: python bulkload.py <file in testcase/> [--batch-size N] [--backend NAME]
+def main(argv=None):
+    from BusRoute import DatabaseCLI
+    from backends import BACKENDS, create_backend
+
+    parser = argparse.ArgumentParser(description='Bulk load a command CSV')
+    parser.add_argument('csv_file', help='file name inside testcase/')
+    parser.add_argument('--batch-size', type=int, default=1000, help='rows per transaction (default: 1000)')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='mysql', help='storage backend (default: mysql)')
+    parser.add_argument('--sqlite-path', default='busroute.db', help='database file for the sqlite backend')
+    options = parser.parse_args(argv)
+
+    cli = DatabaseCLI(options.csv_file, create_backend(options.backend, options.sqlite_path))
+    BulkLoader(cli, options.batch_size).load(cli.csv_file)
+    cli.backend.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
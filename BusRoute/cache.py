@@ -0,0 +1,79 @@
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """LRU cache, with an optional TTL, for the printed output of the read commands.
+
+    Every entry carries tags such as ('terminal', name) or ('route', number) naming the data
+    it was built from, so a change only evicts the entries that depend on what it touched.
+    """
+
+    def __init__(self, max_entries=1024, ttl=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.entries = OrderedDict()  # key -> (output, tags, expiry time or None)
+        self.tagged = {}              # tag -> keys of the entries carrying it
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None and entry[2] is not None and entry[2] <= time.monotonic():
+            self.remove(key)
+            self.evictions += 1
+            entry = None
+
+        if entry is None:
+            self.misses += 1
+            return None
+
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[0]
+
+    def put(self, key, output, tags):
+        if key in self.entries:
+            self.remove(key)
+
+        expiry = time.monotonic() + self.ttl if self.ttl else None
+        self.entries[key] = (output, frozenset(tags), expiry)
+        for tag in tags:
+            self.tagged.setdefault(tag, set()).add(key)
+
+        while len(self.entries) > self.max_entries:
+            self.remove(next(iter(self.entries)))
+            self.evictions += 1
+
+    def remove(self, key):
+        _, tags, _ = self.entries.pop(key)
+        for tag in tags:
+            keys = self.tagged.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tagged[tag]
+
+    def invalidate(self, tags):
+        """Evicts every entry carrying any of the given tags."""
+
+        for tag in tags:
+            for key in list(self.tagged.get(tag, ())):
+                self.remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        self.invalidations += len(self.entries)
+        self.entries.clear()
+        self.tagged.clear()
+
+    def stats(self):
+        return {
+            'entries': len(self.entries),
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations,
+        }
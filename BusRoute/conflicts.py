@@ -0,0 +1,56 @@
+import bisect
+from departures import DepartureStore
+
+
+# Departures are allowed from 05:00 to 23:00 inclusive, one bitmap slot per minute
+FIRST_MINUTE = 5 * 60
+LAST_MINUTE = 23 * 60
+HEADWAY_MINUTES = 14
+
+
+# Function to turn an hhmm departure time into minutes since midnight, None if it is not a time from 05:00 to 23:00
+def departure_minutes(start_time_str):
+    if len(start_time_str) != 4 or not start_time_str.isdigit():
+        return None
+    hours, minutes = int(start_time_str[:2]), int(start_time_str[2:])
+    if minutes > 59 or not FIRST_MINUTE <= hours * 60 + minutes <= LAST_MINUTE:
+        return None
+    return hours * 60 + minutes
+
+
+class ConflictIndex:
+    """Schedule conflict checks for the l command without a database round trip.
+
+    The departures loaded from the database sit in a columnar DepartureStore; those added since
+    are kept in a sorted list per route. Together they cover the +/-14 minute headway rule, and
+    a bitmap of occupied minutes covers the rule that no two buses leave at the same time.
+    """
+
+    def __init__(self, departures=()):
+        departures = list(departures)
+        self.store = DepartureStore(departures)
+        self.route_times = {}
+        self.occupied = bytearray(LAST_MINUTE - FIRST_MINUTE + 1)
+        for route_number, minutes in departures:
+            self.occupy(minutes)
+
+    def occupy(self, minutes):
+        if FIRST_MINUTE <= minutes <= LAST_MINUTE:
+            self.occupied[minutes - FIRST_MINUTE] = 1
+
+    def add(self, route_number, minutes):
+        bisect.insort(self.route_times.setdefault(route_number, []), minutes)
+        self.occupy(minutes)
+
+    def conflicts(self, route_number, minutes):
+        """Returns True if a departure at minutes clashes with the route's schedule or any other bus."""
+
+        if FIRST_MINUTE <= minutes <= LAST_MINUTE and self.occupied[minutes - FIRST_MINUTE]:
+            return True
+
+        if self.store.within(minutes, HEADWAY_MINUTES, route_number):
+            return True
+
+        times = self.route_times.get(route_number, [])
+        index = bisect.bisect_left(times, minutes - HEADWAY_MINUTES)
+        return index < len(times) and times[index] <= minutes + HEADWAY_MINUTES
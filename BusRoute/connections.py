@@ -0,0 +1,40 @@
+import bisect
+
+
+class ConnectionIndex:
+    """The C command's answers kept ready per (source, destination) pair.
+
+    direct holds the sorted (route, fare) pairs and transfers the sorted (route1, route2,
+    total fare) pairs that change once at a shared terminal. Adding a route only touches the
+    pairs it creates, found through the routes arriving at its source and leaving its destination.
+    Terminals are keyed by name_key, so names match the way the backend compares them.
+    """
+
+    def __init__(self, routes=(), name_key=lambda name: name):
+        self.name_key = name_key
+        self.direct = {}     # (source, destination) -> [(route, fare)]
+        self.transfers = {}  # (source, destination) -> [(route1, route2, total fare)]
+        self.outbound = {}   # terminal -> [(route, destination, fare)]
+        self.inbound = {}    # terminal -> [(route, source, fare)]
+        for route_num, source, destination, travel_time, fare in routes:
+            self.add(route_num, source, destination, fare)
+
+    def add(self, route_num, source, destination, fare):
+        source, destination = self.name_key(source), self.name_key(destination)
+        bisect.insort(self.direct.setdefault((source, destination), []), (route_num, fare))
+        self.outbound.setdefault(source, []).append((route_num, destination, fare))
+        self.inbound.setdefault(destination, []).append((route_num, source, fare))
+
+        # Routes into the new route's source now connect through it, and it connects to routes out of its destination
+        for first_route, first_source, first_fare in self.inbound.get(source, ()):
+            bisect.insort(self.transfers.setdefault((first_source, destination), []), (first_route, route_num, first_fare + fare))
+        for second_route, second_destination, second_fare in self.outbound.get(destination, ()):
+            # A route from a terminal back to itself was already paired with itself above
+            if second_route != route_num:
+                bisect.insort(self.transfers.setdefault((source, second_destination), []), (route_num, second_route, fare + second_fare))
+
+    def lookup(self, source, destination):
+        """Returns the direct routes [(route, fare)] and one-change pairs [(route1, route2, total fare)]."""
+
+        key = (self.name_key(source), self.name_key(destination))
+        return self.direct.get(key, []), self.transfers.get(key, [])
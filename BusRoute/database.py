@@ -0,0 +1,165 @@
+import os
+import sys
+import mysql.connector
+from mysql.connector import Error, pooling
+from mysql.connector.errors import InterfaceError, OperationalError, PoolError
+
+
+# Connection settings, overridable from the environment
+DB_CONFIG = {
+    'host': os.environ.get('BUSROUTE_DB_HOST', 'localhost'),
+    'user': os.environ.get('BUSROUTE_DB_USER', 'cs5330'),
+    'password': os.environ.get('BUSROUTE_DB_PASSWORD', 'pw5330'),
+}
+DB_NAME = os.environ.get('BUSROUTE_DB_NAME', 'dbprog')
+
+# F opens up to 3 streams, each on a pooled connection of its own, next to the connection of the CLI
+# that runs it. The pool has room for that on the CLI and on each of the 4 parallel read workers.
+STREAMS_PER_COMMAND = 3
+READ_WORKERS = 4
+POOL_SIZE = int(os.environ.get('BUSROUTE_DB_POOL_SIZE', str((1 + READ_WORKERS) * (1 + STREAMS_PER_COMMAND))))
+
+
+class Database:
+    """Pooled MySQL access for the CLI.
+
+    The schema is selected once when the pool is created, so commands no longer send
+    USE dbprog. Fixed queries run through server-side prepared statements that stay
+    prepared for the life of the connection, so each call is a single round trip.
+    """
+
+    def __init__(self, pool_size=POOL_SIZE, db_name=DB_NAME, **config):
+        self.db_name = db_name
+        self.config = dict(DB_CONFIG, **config)
+        self.pool_size = pool_size
+        self.pool = None
+        self._connection = None
+        self.statements = {}
+
+    # Creates the schema if needed, then opens the pool on it; a failure is raised to the command
+    def connect(self):
+        connection = mysql.connector.connect(**self.config)
+        with connection.cursor() as cursor:
+            cursor.execute(f"CREATE DATABASE IF NOT EXISTS {self.db_name}")
+        connection.close()
+
+        self.pool = pooling.MySQLConnectionPool(
+            pool_name=f"busroute_{id(self)}",
+            pool_size=self.pool_size,
+            database=self.db_name,
+            **self.config
+        )
+        # On stderr: the pool opens on first use, in the middle of a command's output
+        print("Connecting to the Bus Routes server...", file=sys.stderr)
+
+    # The connection used by this CLI; it is only checked when a statement fails, not pinged per call
+    @property
+    def connection(self):
+        if self.pool is None:
+            self.connect()
+        if self._connection is None:
+            self._connection = self.pool.get_connection()
+        return self._connection
+
+    # After a dropped socket: reconnect, and forget the statements prepared on the old session
+    def reconnect(self):
+        for cursor in self.statements.values():
+            try:
+                cursor.close()
+            except Error:
+                pass
+        self.statements = {}
+        self._connection.reconnect(attempts=3, delay=1)
+
+    # A Database on the same pool with a connection of its own, for another thread. The connection is
+    # taken now, so the worker's streams can never leave it without one.
+    def worker(self):
+        if self.pool is None:
+            self.connect()
+        worker = Database(self.pool_size, self.db_name, **self.config)
+        worker.pool = self.pool
+        worker._connection = self.pool.get_connection()
+        return worker
+
+    def cursor(self):
+        return self.connection.cursor()
+
+    # Another pooled connection, for callers that need one of their own
+    def get_connection(self):
+        if self.pool is None:
+            self.connect()
+        return self.pool.get_connection()
+
+    def query(self, sql, params=()):
+        """Runs a fixed query as a prepared statement and returns all rows.
+
+        If the connection was lost, it is reconnected. A plain SELECT is then sent again; any
+        other statement raises, since the transaction it belonged to is gone.
+        """
+
+        try:
+            return self._query(sql, params)
+        except (OperationalError, InterfaceError):
+            self.reconnect()
+            if not sql.lstrip().upper().startswith('SELECT') or 'FOR UPDATE' in sql.upper():
+                raise
+            return self._query(sql, params)
+
+    def _query(self, sql, params):
+        connection = self.connection
+        cursor = self.statements.get(sql)
+        if cursor is None:
+            cursor = connection.cursor(prepared=True)
+            self.statements[sql] = cursor
+        cursor.execute(sql, params)
+        return cursor.fetchall() if cursor.with_rows else []
+
+    def stream(self, sql, params=(), batch_size=1000):
+        """Yields the rows of a query from an unbuffered cursor, batch_size rows at a time.
+
+        An unbuffered result ties up its connection until it is read, so each stream takes a
+        pooled connection of its own. If the pool is used up the rows are fetched all at once on
+        this Database's own connection, which is taken before the stream's.
+        """
+
+        # The property takes this Database's own connection if it has none yet
+        self.connection
+        try:
+            connection = self.get_connection()
+        except PoolError:
+            yield from self.query(sql, params)
+            return
+
+        try:
+            cursor = connection.cursor()
+            cursor.execute(sql, params)
+            while True:
+                rows = cursor.fetchmany(batch_size)
+                if not rows:
+                    break
+                yield from rows
+            cursor.close()
+        finally:
+            connection.close()
+
+    def commit(self):
+        try:
+            self.connection.commit()
+        except (OperationalError, InterfaceError):
+            self.reconnect()
+            raise
+
+    def rollback(self):
+        try:
+            self.connection.rollback()
+        except (OperationalError, InterfaceError):
+            # The server already dropped the transaction with the connection
+            self.reconnect()
+
+    def close(self):
+        for cursor in self.statements.values():
+            cursor.close()
+        self.statements = {}
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
@@ -0,0 +1,131 @@
+import bisect
+from array import array
+
+# NumPy is optional; without it the same queries run with bisect over the arrays
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+# Route counts above which a window query scans the whole minutes column with NumPy
+VECTOR_MIN_ROUTES = 32
+
+# The largest minutes value a departure column holds
+MAX_MINUTES = 0xFFFF
+
+
+class DepartureStore:
+    """LeaveTime held as columns: departure minutes grouped by route, in CSR layout.
+
+    route_nums lists the routes in order, and offsets[i]:offsets[i + 1] is where route i's
+    departures sit in minutes, sorted. Minutes fit an unsigned short, so a departure costs
+    two bytes plus its share of the route index. all_minutes keeps every departure sorted
+    for the checks that ignore the route.
+    """
+
+    def __init__(self, departures=()):
+        # departures: (RouteNum, minutes since midnight)
+        rows = sorted(departures)
+        self.route_nums = array('i')
+        self.offsets = array('I', [0])
+        self.minutes = array('H')
+        for route_num, minutes in rows:
+            if not self.route_nums or self.route_nums[-1] != route_num:
+                if self.route_nums:
+                    self.offsets.append(len(self.minutes))
+                self.route_nums.append(route_num)
+            self.minutes.append(minutes)
+        if self.route_nums:
+            self.offsets.append(len(self.minutes))
+
+        self.position = {route_num: index for index, route_num in enumerate(self.route_nums)}
+        self.all_minutes = array('H', sorted(self.minutes))
+        self._vectors = None
+
+    def __len__(self):
+        return len(self.minutes)
+
+    @property
+    def nbytes(self):
+        return sum(column.itemsize * len(column) for column in (self.route_nums, self.offsets, self.minutes, self.all_minutes))
+
+    def span(self, route_num):
+        """Returns where a route's departures start and end in minutes."""
+
+        index = self.position.get(route_num)
+        if index is None:
+            return 0, 0
+        return self.offsets[index], self.offsets[index + 1]
+
+    def times(self, route_num):
+        start, end = self.span(route_num)
+        return self.minutes[start:end]
+
+    def between(self, route_nums, low, high=None):
+        """Returns (minutes, route) for each departure of the given routes in [low, high], by time.
+
+        Without high every departure from low on is returned.
+        """
+
+        route_nums = list(route_nums)
+        if high is None:
+            high = MAX_MINUTES
+        if numpy is not None and len(route_nums) > VECTOR_MIN_ROUTES:
+            return self._between_vector(route_nums, low, high)
+
+        found = []
+        for route_num in route_nums:
+            start, end = self.span(route_num)
+            index = bisect.bisect_left(self.minutes, low, start, end)
+            stop = bisect.bisect_right(self.minutes, high, index, end)
+            found.extend((self.minutes[position], route_num) for position in range(index, stop))
+        found.sort()
+        return found
+
+    def within(self, minutes, k, route_num=None):
+        """Returns True if a departure (of route_num, or of any route) falls within k minutes of minutes."""
+
+        if route_num is None:
+            column, start, end = self.all_minutes, 0, len(self.all_minutes)
+        else:
+            column = self.minutes
+            start, end = self.span(route_num)
+        index = bisect.bisect_left(column, minutes - k, start, end)
+        return index < end and column[index] <= minutes + k
+
+    def within_many(self, candidates, k, route_num=None):
+        """Returns one within() answer per candidate minute, in a single vector pass when NumPy is there."""
+
+        if numpy is None:
+            return [self.within(minutes, k, route_num) for minutes in candidates]
+
+        if route_num is None:
+            column = self._numpy()[0]
+        else:
+            start, end = self.span(route_num)
+            column = self._numpy()[1][start:end]
+        if not len(column):
+            return [False] * len(candidates)
+        candidates = numpy.asarray(candidates, dtype=numpy.int32)
+        index = numpy.searchsorted(column, candidates - k, side='left')
+        nearest = column[numpy.minimum(index, len(column) - 1)]
+        return ((index < len(column)) & (nearest <= candidates + k)).tolist()
+
+    # NumPy views of the columns, plus each departure's route position, made on first use
+    def _numpy(self):
+        if self._vectors is None:
+            minutes = numpy.frombuffer(self.minutes, dtype=numpy.uint16).astype(numpy.int32)
+            counts = numpy.diff(numpy.frombuffer(self.offsets, dtype=numpy.uint32))
+            owners = numpy.repeat(numpy.arange(len(self.route_nums)), counts)
+            self._vectors = (numpy.frombuffer(self.all_minutes, dtype=numpy.uint16).astype(numpy.int32), minutes, owners)
+        return self._vectors
+
+    def _between_vector(self, route_nums, low, high):
+        _, minutes, owners = self._numpy()
+        wanted = numpy.zeros(len(self.route_nums), dtype=bool)
+        wanted[numpy.array([self.position[route_num] for route_num in route_nums if route_num in self.position], dtype=numpy.intp)] = True
+        mask = wanted[owners] & (minutes >= low) & (minutes <= high)
+        selected = numpy.flatnonzero(mask)
+        selected = selected[numpy.argsort(minutes[selected], kind='stable')]
+        return [(int(minutes[position]), self.route_nums[int(owners[position])]) for position in selected]
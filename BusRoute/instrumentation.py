@@ -0,0 +1,186 @@
+import contextlib
+import json
+import os
+import threading
+import time
+
+
+# Calls on an SQL backend that each go to the database once
+BACKEND_CALLS = ('query', 'stream', 'execute_many', 'commit', 'rollback')
+
+
+class Histogram:
+    """Counts values in power-of-two buckets, so percentiles cost no memory per sample."""
+
+    def __init__(self):
+        self.buckets = {}  # bit length of the value -> count
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        value = int(value)
+        bucket = value.bit_length()
+        self.buckets[bucket] = self.buckets.get(bucket, 0) + 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, fraction):
+        """Returns the upper bound of the bucket holding the given fraction of values."""
+
+        if not self.count:
+            return 0
+        seen = 0
+        for bucket in sorted(self.buckets):
+            seen += self.buckets[bucket]
+            if seen >= fraction * self.count:
+                return min((1 << bucket) - 1, self.max)
+        return self.max
+
+    def mean(self):
+        return self.total / self.count if self.count else 0
+
+
+class CommandStats:
+    """Histograms for one command: wall, database and Python time in microseconds, rows fetched and round trips."""
+
+    def __init__(self):
+        self.wall = Histogram()
+        self.db = Histogram()
+        self.python = Histogram()
+        self.rows = Histogram()
+        self.round_trips = Histogram()
+
+
+class Instrumentation:
+    """Times each command and each database call made while it runs.
+
+    Commands may nest (run calls onecmd for each row), so every thread keeps a stack of open
+    commands and database time is added to all of them. When tracing, each command and
+    database call is also kept as a Chrome trace event.
+    """
+
+    def __init__(self):
+        self.commands = {}  # command name -> CommandStats
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.trace_events = None
+        self.started = time.perf_counter()
+
+    # The open commands on this thread, each [db seconds, rows, round trips]
+    def stack(self):
+        stack = getattr(self.local, 'stack', None)
+        if stack is None:
+            stack = self.local.stack = []
+        return stack
+
+    @contextlib.contextmanager
+    def command(self, name):
+        frame = [0.0, 0, 0]
+        stack = self.stack()
+        stack.append(frame)
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            wall = time.perf_counter() - started
+            stack.pop()
+            self.record(name or 'empty', wall, *frame)
+            self.trace(name or 'empty', 'command', started, wall)
+
+    def record(self, name, wall, db, rows, round_trips):
+        with self.lock:
+            stats = self.commands.get(name)
+            if stats is None:
+                stats = self.commands[name] = CommandStats()
+            stats.wall.add(wall * 1e6)
+            stats.db.add(db * 1e6)
+            stats.python.add(max(wall - db, 0) * 1e6)
+            stats.rows.add(rows)
+            stats.round_trips.add(round_trips)
+
+    def database(self, call, started, seconds, rows):
+        for frame in self.stack():
+            frame[0] += seconds
+            frame[1] += rows
+            frame[2] += 1
+        self.trace(call, 'database', started, seconds)
+
+    def trace(self, name, category, started, seconds):
+        if self.trace_events is not None:
+            self.trace_events.append({
+                'name': name,
+                'cat': category,
+                'ph': 'X',
+                'ts': round((started - self.started) * 1e6, 1),
+                'dur': round(seconds * 1e6, 1),
+                'pid': os.getpid(),
+                'tid': threading.get_ident(),
+            })
+
+    def wrap_backend(self, backend):
+        """Times the database calls of an SQL backend; other backends are left as they are."""
+
+        if getattr(backend, 'instrumented', False):
+            return backend
+        for call in BACKEND_CALLS:
+            method = getattr(backend, call, None)
+            if method is not None:
+                setattr(backend, call, self._timed_stream(method) if call == 'stream' else self._timed(call, method))
+        backend.instrumented = True
+        return backend
+
+    def _timed(self, call, method):
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            result = method(*args, **kwargs)
+            self.database(call, started, time.perf_counter() - started, len(result) if isinstance(result, list) else 0)
+            return result
+        return timed
+
+    def _timed_stream(self, method):
+        # A stream's time is spent while it is read, so each step is timed and counted as it happens
+        def timed(*args, **kwargs):
+            started = time.perf_counter()
+            rows = iter(method(*args, **kwargs))
+            self.database('stream', started, time.perf_counter() - started, 0)
+            while True:
+                started = time.perf_counter()
+                row = next(rows, None)
+                seconds = time.perf_counter() - started
+                for frame in self.stack():
+                    frame[0] += seconds
+                    frame[1] += row is not None
+                if row is None:
+                    return
+                yield row
+        return timed
+
+    def start_trace(self):
+        self.trace_events = []
+
+    def write_trace(self, path):
+        with open(path, 'w') as file:
+            json.dump({'traceEvents': self.trace_events or [], 'displayTimeUnit': 'ms'}, file)
+        self.trace_events = None
+
+    def reset(self):
+        with self.lock:
+            self.commands = {}
+
+    def report(self):
+        """Returns one line per command, slowest total wall time first."""
+
+        lines = []
+        with self.lock:
+            ordered = sorted(self.commands.items(), key=lambda item: item[1].wall.total, reverse=True)
+            for name, stats in ordered:
+                lines.append(
+                    f"{name} calls {stats.wall.count} "
+                    f"wall p50 {stats.wall.percentile(0.5) / 1000:.3f}ms p99 {stats.wall.percentile(0.99) / 1000:.3f}ms "
+                    f"max {stats.wall.max / 1000:.3f}ms "
+                    f"db mean {stats.db.mean() / 1000:.3f}ms python mean {stats.python.mean() / 1000:.3f}ms "
+                    f"rows mean {stats.rows.mean():.1f} round trips mean {stats.round_trips.mean():.1f}"
+                )
+        return lines
@@ -0,0 +1,192 @@
+import csv
+import hashlib
+import heapq
+import os
+import struct
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+
+
+# File header: magic, terminal count and the fingerprint of the routes, then the names and two n x n columns
+MAGIC = b'BUSMTRX2'
+HEADER = struct.Struct('<8sI32s')
+TEXT_LENGTH = struct.Struct('<H')
+
+# Cell values for a pair with no path
+NO_FARE = 0xFFFFFFFF
+NO_HOPS = 0xFF
+
+# Adjacency (terminal index -> [(next terminal index, fare in cents)]) for the pool's processes
+_graph = None
+
+
+# Function to hash the terminals and the route endpoints and fares a matrix is computed from
+def fingerprint(terminal_names, routes):
+    digest = hashlib.sha256()
+    for name in sorted(terminal_names):
+        digest.update(f"t,{name}\n".encode())
+    for route_num, source, destination, travel_time, fare in sorted(routes, key=lambda route: int(route[0])):
+        digest.update(f"b,{int(route_num)},{source},{destination},{int(Decimal(fare) * 100)}\n".encode())
+    return digest.digest()
+
+
+def _set_graph(graph):
+    global _graph
+    _graph = graph
+
+
+def _rows(sources):
+    # Cheapest fare (Dijkstra on cents) and fewest buses (breadth-first) from each source index
+    size = len(_graph)
+    rows = []
+    for source in sources:
+        fares = array('I', [NO_FARE]) * size
+        fares[source] = 0
+        heap = [(0, source)]
+        while heap:
+            fare, terminal = heapq.heappop(heap)
+            if fare > fares[terminal]:
+                continue
+            for next_terminal, cents in _graph[terminal]:
+                if fare + cents < fares[next_terminal]:
+                    fares[next_terminal] = fare + cents
+                    heapq.heappush(heap, (fare + cents, next_terminal))
+
+        hops = array('B', [NO_HOPS]) * size
+        hops[source] = 0
+        queue = deque([source])
+        while queue:
+            terminal = queue.popleft()
+            if hops[terminal] + 1 >= NO_HOPS:
+                continue
+            for next_terminal, _ in _graph[terminal]:
+                if hops[next_terminal] == NO_HOPS:
+                    hops[next_terminal] = hops[terminal] + 1
+                    queue.append(next_terminal)
+
+        rows.append((source, fares.tobytes(), hops.tobytes()))
+    return rows
+
+
+class FareMatrix:
+    """Cheapest fare and fewest buses between every pair of terminals, over any number of changes.
+
+    fares (cents) and hops are n x n arrays in the order of terminals. A pair with no path holds
+    NO_FARE and NO_HOPS. Kept by the CLI after matrix build or load, so C can answer pairs with
+    no route within one change without a lookup, until b or r changes the routes. source_fingerprint
+    identifies the terminals and routes it was built from, so a saved matrix is only loaded for them.
+    Terminals are looked up by name_key, so names match the way the backend compares them.
+    """
+
+    def __init__(self, terminals, fares, hops, source_fingerprint, name_key=lambda name: name):
+        self.terminals = list(terminals)
+        self.name_key = name_key
+        self.index = {name_key(name): position for position, name in enumerate(self.terminals)}
+        self.fares = fares
+        self.hops = hops
+        self.source_fingerprint = source_fingerprint
+
+    @classmethod
+    def build(cls, terminal_names, routes, workers=None, name_key=lambda name: name):
+        """Computes the matrix from the routes, splitting source terminals across a process pool."""
+
+        # One terminal per name key, under the name it was stored with
+        names = {}
+        for name in terminal_names:
+            names.setdefault(name_key(name), name)
+        for route_num, source, destination, travel_time, fare in routes:
+            names.setdefault(name_key(source), source)
+            names.setdefault(name_key(destination), destination)
+        terminals = [names[key] for key in sorted(names)]
+        index = {name_key(name): position for position, name in enumerate(terminals)}
+
+        graph = [[] for _ in terminals]
+        for route_num, source, destination, travel_time, fare in routes:
+            graph[index[name_key(source)]].append((index[name_key(destination)], int(Decimal(fare) * 100)))
+
+        size = len(terminals)
+        workers = workers or os.cpu_count() or 1
+        chunks = [list(range(start, size, workers)) for start in range(min(workers, size))]
+        if workers > 1 and size > 1:
+            with ProcessPoolExecutor(workers, initializer=_set_graph, initargs=(graph,)) as pool:
+                results = [row for rows in pool.map(_rows, chunks) for row in rows]
+        else:
+            _set_graph(graph)
+            results = _rows(range(size))
+
+        fares = array('I', [NO_FARE]) * (size * size)
+        hops = array('B', [NO_HOPS]) * (size * size)
+        for source, fare_row, hop_row in results:
+            fares[source * size:(source + 1) * size] = array('I', fare_row)
+            hops[source * size:(source + 1) * size] = array('B', hop_row)
+        return cls(terminals, fares, hops, fingerprint(terminal_names, routes), name_key)
+
+    def lookup(self, source, destination):
+        """Returns (cheapest fare as Decimal, fewest buses) or None if there is no path."""
+
+        source, destination = self.name_key(source), self.name_key(destination)
+        if source not in self.index or destination not in self.index:
+            return None
+        cell = self.index[source] * len(self.terminals) + self.index[destination]
+        if self.hops[cell] == NO_HOPS:
+            return None
+        return Decimal(self.fares[cell]).scaleb(-2), self.hops[cell]
+
+    def within(self, source, destination, buses):
+        """Returns False only when the matrix shows no path from source to destination using at most buses buses."""
+
+        if self.name_key(source) == self.name_key(destination):
+            return True
+        found = self.lookup(source, destination)
+        return found is not None and found[1] <= buses
+
+    def save(self, prefix):
+        """Writes prefix.bin (binary matrix) and prefix.csv (one row per connected pair)."""
+
+        with open(prefix + '.bin', 'wb') as file:
+            file.write(HEADER.pack(MAGIC, len(self.terminals), self.source_fingerprint))
+            for name in self.terminals:
+                data = name.encode()
+                file.write(TEXT_LENGTH.pack(len(data)))
+                file.write(data)
+            self.fares.tofile(file)
+            self.hops.tofile(file)
+
+        with open(prefix + '.csv', 'w', newline='') as file:
+            writer = csv.writer(file)
+            writer.writerow(['Source', 'Destination', 'Fare', 'Buses'])
+            for source in self.terminals:
+                for destination in self.terminals:
+                    found = self.lookup(source, destination)
+                    if source != destination and found is not None:
+                        writer.writerow([source, destination, f"{found[0]:.2f}", found[1]])
+
+    @classmethod
+    def load(cls, prefix, expected_fingerprint, name_key=lambda name: name):
+        """Reads prefix.bin, refusing a matrix built from routes other than those expected_fingerprint names."""
+
+        with open(prefix + '.bin', 'rb') as file:
+            view = memoryview(file.read())
+
+        if len(view) < HEADER.size or HEADER.unpack_from(view, 0)[0] != MAGIC:
+            raise ValueError(f"{prefix}.bin is not a Bus Routes fare matrix of this version; run matrix build {prefix}")
+        magic, size, source_fingerprint = HEADER.unpack_from(view, 0)
+        if source_fingerprint != expected_fingerprint:
+            raise ValueError(f"{prefix}.bin was built from different terminals or routes; run matrix build {prefix}")
+        offset = HEADER.size
+
+        terminals = []
+        for _ in range(size):
+            (length,) = TEXT_LENGTH.unpack_from(view, offset)
+            offset += TEXT_LENGTH.size
+            terminals.append(bytes(view[offset:offset + length]).decode())
+            offset += length
+
+        fares = array('I')
+        fares.frombytes(view[offset:offset + size * size * fares.itemsize])
+        offset += size * size * fares.itemsize
+        hops = array('B')
+        hops.frombytes(view[offset:offset + size * size])
+        return cls(terminals, fares, hops, source_fingerprint, name_key)
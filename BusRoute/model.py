@@ -0,0 +1,122 @@
+import sys
+from decimal import Decimal
+from backends import to_fare
+from departures import DepartureStore
+
+
+# Fares are whole cents; to_fare applies the DECIMAL(5,2) rounding and range check first
+def to_cents(value):
+    return int(to_fare(value).scaleb(2))
+
+
+class Terminal:
+    """A terminal with its interned integer id; routes refer to terminals by id."""
+
+    __slots__ = ('id', 'name', 'district')
+
+    def __init__(self, id, name, district):
+        self.id = id
+        self.name = name
+        self.district = district
+
+    def __repr__(self):
+        return f"Terminal({self.id}, {self.name!r}, {self.district!r})"
+
+
+class Route:
+    """A route with its terminals as ids and its fare in integer cents."""
+
+    __slots__ = ('route_num', 'source', 'destination', 'travel_time', 'fare_cents')
+
+    def __init__(self, route_num, source, destination, travel_time, fare_cents):
+        self.route_num = route_num
+        self.source = source
+        self.destination = destination
+        self.travel_time = travel_time
+        self.fare_cents = fare_cents
+
+    @property
+    def fare(self):
+        return Decimal(self.fare_cents).scaleb(-2)
+
+    def __repr__(self):
+        return f"Route({self.route_num}, {self.source}, {self.destination}, {self.travel_time}, {self.fare_cents})"
+
+
+class Departure:
+    """One departure, made on demand from the columns of the store; none are kept."""
+
+    __slots__ = ('route_num', 'minutes')
+
+    def __init__(self, route_num, minutes):
+        self.route_num = route_num
+        self.minutes = minutes
+
+    def __repr__(self):
+        return f"Departure({self.route_num}, {self.minutes // 60}:{self.minutes % 60:02d})"
+
+
+class Network:
+    """Terminals, routes and departures held compactly for in-process features.
+
+    Terminal names are interned to integer ids in the order they are added. Terminals and routes
+    are __slots__ objects; departures stay in a columnar DepartureStore, two bytes of minutes each
+    plus their share of the route index, and are only turned into Departure objects when asked for.
+    """
+
+    def __init__(self, terminals=(), routes=(), departures=()):
+        # terminals: (Name, District), routes: (RouteNum, Source, Destination, TravelTime, Fare),
+        # departures: (RouteNum, minutes since midnight), as backend.dump() returns them
+        self.terminals = []  # id -> Terminal
+        self.ids = {}        # name -> id
+        self.routes = {}     # RouteNum -> Route
+        for name, district in terminals:
+            self.add_terminal(name, district)
+        for route_num, source, destination, travel_time, fare in routes:
+            self.add_route(route_num, source, destination, travel_time, fare)
+        self.departures = DepartureStore(departures)
+
+    @classmethod
+    def from_backend(cls, backend):
+        return cls(*backend.dump())
+
+    def terminal_id(self, name):
+        """Returns the id of a terminal name, interning names seen for the first time."""
+
+        terminal_id = self.ids.get(name)
+        if terminal_id is None:
+            name = sys.intern(name)
+            terminal_id = self.ids[name] = len(self.terminals)
+            self.terminals.append(Terminal(terminal_id, name, None))
+        return terminal_id
+
+    def add_terminal(self, name, district):
+        terminal = self.terminals[self.terminal_id(name)]
+        terminal.district = district
+        return terminal
+
+    def add_route(self, route_num, source, destination, travel_time, fare):
+        route = Route(int(route_num), self.terminal_id(source), self.terminal_id(destination), int(travel_time), to_cents(fare))
+        self.routes[route.route_num] = route
+        return route
+
+    def terminal(self, name):
+        terminal_id = self.ids.get(name)
+        return None if terminal_id is None else self.terminals[terminal_id]
+
+    def route(self, route_num):
+        return self.routes.get(route_num)
+
+    def route_departures(self, route_num):
+        """Yields the departures of a route in time order."""
+
+        for minutes in self.departures.times(route_num):
+            yield Departure(route_num, minutes)
+
+    def __len__(self):
+        return len(self.departures)
+
+    @property
+    def nbytes(self):
+        """Bytes held by the departure columns, the part that grows with the timetable."""
+        return self.departures.nbytes
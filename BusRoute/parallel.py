@@ -0,0 +1,135 @@
+import contextlib
+import io
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+# Commands that only read data and can run in any order
+READ_ONLY_COMMANDS = ('T', 'B', 'C', 'D', 'F', 'J', 'A')
+
+_local = threading.local()
+
+
+class ThreadLocalStdout:
+    """Stands in for sys.stdout so each thread can capture what it prints on its own."""
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, text):
+        buffer = getattr(_local, 'buffer', None)
+        return (buffer if buffer is not None else self.stream).write(text)
+
+    def flush(self):
+        buffer = getattr(_local, 'buffer', None)
+        (buffer if buffer is not None else self.stream).flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+# Puts a ThreadLocalStdout in place of sys.stdout once, and returns it
+def thread_local_stdout():
+    if not isinstance(sys.stdout, ThreadLocalStdout):
+        sys.stdout = ThreadLocalStdout(sys.stdout)
+    return sys.stdout
+
+
+@contextlib.contextmanager
+def capture():
+    """Collects everything the current thread prints into the yielded StringIO."""
+
+    thread_local_stdout()
+
+    previous = getattr(_local, 'buffer', None)
+    _local.buffer = io.StringIO()
+    try:
+        yield _local.buffer
+    finally:
+        _local.buffer = previous
+
+
+class ParallelReader:
+    """Runs a run of read-only commands on a thread pool and prints the results in input order.
+
+    Each worker thread has its own DatabaseCLI on its own backend connection. Cache lookups
+    and cache updates happen on the calling thread, so the result cache stays single-threaded.
+    Backends that cannot be shared across threads run the commands inline instead.
+    """
+
+    def __init__(self, cli, workers=None):
+        self.cli = cli
+        self.workers = workers or min(4, os.cpu_count() or 1)
+        self.local = threading.local()
+        self.worker_clis = []
+        self.lock = threading.Lock()
+
+        # The first worker backend doubles as the check that the backend can be shared at all
+        self.spare_backends = []
+        self.pool = None
+        if self.workers > 1:
+            backend = cli.backend.worker()
+            if backend is not None:
+                self.spare_backends.append(backend)
+                self.pool = ThreadPoolExecutor(self.workers)
+
+    def worker_cli(self):
+        worker = getattr(self.local, 'cli', None)
+        if worker is None:
+            with self.lock:
+                backend = self.spare_backends.pop() if self.spare_backends else self.cli.backend.worker()
+                worker = self.cli.worker(backend)
+                self.worker_clis.append(worker)
+            self.local.cli = worker
+        worker.engine = self.cli.engine
+        worker.timetable = self.cli.timetable
+        worker.connection_index = self.cli.connection_index
+        return worker
+
+    def execute(self, line):
+        return self.read(self.worker_cli(), line)
+
+    @staticmethod
+    def read(cli, line):
+        with cli.stats.command(cli.parseline(line)[0]):
+            return cli.read_command(line)
+
+    def run(self, lines):
+        # Build the shared in-memory indexes once, before the workers read them
+        self.cli.load_connections()
+        if self.cli.engine == 'memory' or any(self.cli.parseline(line)[0] in ('J', 'A') for line in lines):
+            self.cli.load_timetable()
+
+        outputs = {}
+        futures = {}
+        for index, line in enumerate(lines):
+            key = self.cli.cache_key(line)
+            output = self.cli.cache.get(key) if key is not None else None
+            if output is not None:
+                outputs[index] = output
+            elif self.pool is not None:
+                futures[index] = (key, self.pool.submit(self.execute, line))
+            else:
+                futures[index] = (key, None)
+
+        # Print in input order; a failing command stops the output where serial execution would
+        for index, line in enumerate(lines):
+            if index in outputs:
+                sys.stdout.write(outputs[index])
+                continue
+            key, future = futures[index]
+            output, tags = future.result() if future is not None else self.read(self.cli, line)
+            if key is not None:
+                self.cli.remember(key, output, tags)
+            sys.stdout.write(output)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+        for backend in [worker.backend for worker in self.worker_clis] + self.spare_backends:
+            if backend is not self.cli.backend:
+                backend.close()
+        self.worker_clis = []
+        self.spare_backends = []
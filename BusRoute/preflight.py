@@ -0,0 +1,122 @@
+from backends import to_fare
+from conflicts import ConflictIndex, departure_minutes
+from parallel import READ_ONLY_COMMANDS
+
+
+# Commands that leave the stored rows as they are; any other command may change them
+KEEPS_DATA = READ_ONLY_COMMANDS + ('e', 'engine', 'cache', 'stats', 'matrix', 'test', 'help')
+
+
+class Preflight:
+    """Checks t, b and l rows of a command file in memory before they reach the database.
+
+    The terminal names and route numbers are read once, then kept up to date with the rows of
+    the file that are expected to succeed, so a route or departure can refer to a terminal or
+    route declared earlier in the same file. A row that would be rejected (a duplicate key, an
+    unknown terminal or route, a bad time, a schedule conflict) gets the exact line its handler
+    would print, without touching the database. Anything else, including rows whose handler
+    fails before printing, returns None and runs as before.
+    """
+
+    def __init__(self, cli):
+        self.cli = cli
+        self.terminals = None  # name keys, as the backend compares them
+        self.routes = None     # route numbers
+
+    # Reads the stored terminal names and route numbers, and the departures for the conflict index.
+    # Returns False if they cannot be read (no tables yet, say), so the row runs and its handler reports it.
+    def load(self):
+        if self.terminals is None:
+            try:
+                terminals, routes, departures = self.cli.backend.dump()
+            except Exception:
+                return False
+            key = self.cli.backend.name_key
+            self.terminals = {key(name) for name, district in terminals}
+            self.routes = {int(route[0]) for route in routes}
+            if self.cli.conflicts is None:
+                self.cli.conflicts = ConflictIndex(departures)
+        return True
+
+    def check(self, command, arguments):
+        """Returns the Invalid Input line a row is bound to print, or None if it should run."""
+
+        if command == 'r':
+            self.terminals, self.routes = set(), set()
+            return None
+        if command not in ('t', 'b', 'l'):
+            # Another command may have changed the data, so read it again when next needed
+            if command not in KEEPS_DATA:
+                self.terminals = self.routes = None
+            return None
+
+        if command == 't':
+            return self.check_terminal(arguments)
+        if command == 'b':
+            return self.check_route(arguments)
+        return self.check_departure(arguments)
+
+    def check_terminal(self, arguments):
+        if len(arguments) != 2:
+            return None
+        name, district = arguments
+        if not self.load():
+            return None
+        key = self.cli.backend.name_key(name)
+        if key in self.terminals:
+            return f"t, {name}, {district} Input Invalid"
+        self.terminals.add(key)
+        return None
+
+    def check_route(self, arguments):
+        if len(arguments) != 5:
+            return None
+        try:
+            route_num = int(arguments[0])
+            source_terminal = arguments[1]
+            destination_terminal = arguments[2]
+            travel_time = int(arguments[3])
+            fare = float(arguments[4])
+        except ValueError:
+            return None
+
+        if not self.load():
+            return None
+        key = self.cli.backend.name_key
+        try:
+            valid = (route_num not in self.routes
+                and key(source_terminal) in self.terminals
+                and key(destination_terminal) in self.terminals
+                and travel_time > 0
+                and to_fare(fare))
+        except Exception:
+            valid = False
+        if not valid:
+            return f"b, {route_num}, {source_terminal}, {destination_terminal}, {travel_time}, {fare} Invalid Input"
+        self.routes.add(route_num)
+        return None
+
+    def check_departure(self, arguments):
+        if len(arguments) != 2:
+            return None
+        try:
+            route_number = int(arguments[0])
+        except ValueError:
+            return None
+        if route_number <= 0:
+            return None
+
+        # Same checks as do_l, then the route must exist and the time must not conflict
+        start_time_str = arguments[1]
+        invalid = f"l, {route_number}, {start_time_str} Invalid Input"
+        departure = departure_minutes(start_time_str)
+        if departure is None:
+            return invalid
+
+        if not self.load():
+            return None
+        if route_number not in self.routes:
+            return invalid
+        if self.cli.load_conflicts().conflicts(route_number, departure):
+            return invalid
+        return None
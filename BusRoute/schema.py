@@ -0,0 +1,68 @@
+# Versioned changes applied on top of the tables created by MySQLBackend.ensure_schema.
+# Each entry is (version, description, statements); applied versions are recorded in SchemaVersion.
+MIGRATIONS = [
+    (1, "Indexes for terminal, route and departure lookups", [
+        "CREATE INDEX idx_terminal_district_name ON Terminal (District, Name)",
+        "CREATE INDEX idx_route_source_destination ON Route (Source, Destination)",
+        "CREATE INDEX idx_route_destination_source ON Route (Destination, Source)",
+        "CREATE INDEX idx_leavetime_time_route ON LeaveTime (LeaveTime, RouteNum)",
+    ]),
+    (2, "Minutes since midnight column for departure range scans", [
+        """
+        ALTER TABLE LeaveTime
+        ADD COLUMN LeaveMinutes SMALLINT AS (HOUR(LeaveTime) * 60 + MINUTE(LeaveTime)) STORED
+        """,
+        "CREATE INDEX idx_leavetime_minutes_route ON LeaveTime (LeaveMinutes, RouteNum)",
+        "CREATE INDEX idx_leavetime_route_minutes ON LeaveTime (RouteNum, LeaveMinutes)",
+    ]),
+    (3, "One bus per departure minute, enforced by the table for concurrent writers", [
+        # Departures that share a minute with a lower-numbered route (left by earlier racing writers)
+        # are moved aside to LeaveTimeConflict, so the unique index can be built and nothing is lost
+        """
+        CREATE TABLE IF NOT EXISTS LeaveTimeConflict (
+            RouteNum INT,
+            LeaveTime TIME,
+            PRIMARY KEY (RouteNum, LeaveTime)
+        )
+        """,
+        """
+        INSERT IGNORE INTO LeaveTimeConflict (RouteNum, LeaveTime)
+        SELECT L.RouteNum, L.LeaveTime
+        FROM LeaveTime L
+        JOIN LeaveTime Other ON Other.LeaveMinutes = L.LeaveMinutes AND Other.RouteNum < L.RouteNum
+        """,
+        """
+        DELETE L FROM LeaveTime L
+        JOIN LeaveTime Other ON Other.LeaveMinutes = L.LeaveMinutes AND Other.RouteNum < L.RouteNum
+        """,
+        "CREATE UNIQUE INDEX idx_leavetime_minutes_unique ON LeaveTime (LeaveMinutes)",
+    ]),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+
+def migrate(cursor, target=SCHEMA_VERSION):
+    """Applies every migration newer than the recorded schema version up to target, returns the new version."""
+
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS SchemaVersion (
+            Version INT PRIMARY KEY,
+            Description VARCHAR(255),
+            AppliedAt TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+    """)
+    cursor.execute("SELECT COALESCE(MAX(Version), 0) FROM SchemaVersion")
+    current = cursor.fetchone()[0]
+
+    # MySQL commits each DDL statement, so the version row is written after its statements succeed
+    for version, description, statements in MIGRATIONS:
+        if version <= current or version > target:
+            continue
+        for statement in statements:
+            cursor.execute(statement)
+        cursor.execute("INSERT INTO SchemaVersion (Version, Description) VALUES (%s, %s)", (version, description))
+        print(f"Schema migrated to version {version}: {description}")
+        current = version
+
+    return current
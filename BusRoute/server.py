@@ -0,0 +1,197 @@
+import argparse
+import asyncio
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from parallel import READ_ONLY_COMMANDS, ParallelReader, capture, thread_local_stdout
+
+
+# Most requests a client may have waiting for their response before reading pauses
+PIPELINE_DEPTH = 64
+
+# Marks the end of each response on the wire
+END_OF_RESPONSE = '.'
+
+
+class CommandServer:
+    """Serves the DatabaseCLI command grammar over a line-based TCP or Unix socket.
+
+    A client sends one command per line and gets back exactly what the CLI would print,
+    followed by a line holding a single ".". Clients may pipeline: responses come back
+    in request order, and each request sees the changes sent before it on its connection.
+    Read commands run concurrently on the ParallelReader worker threads; every other command
+    runs alone on one writer thread, with no reads in flight, so the result cache and the
+    backend never see a read and a change at the same time.
+    """
+
+    def __init__(self, cli, workers=None):
+        self.cli = cli
+        # cmd.Cmd writes help to self.stdout, bound when the CLI was made; route it through capture too
+        self.cli.stdout = thread_local_stdout()
+        self.reader = ParallelReader(cli, workers)
+        self.writer = ThreadPoolExecutor(1)
+        self.readers_active = 0
+        self.writing = False
+        self.idle = asyncio.Condition()
+
+    # Shared access for reads, exclusive access for everything else
+    async def acquire(self, exclusive):
+        async with self.idle:
+            if exclusive:
+                await self.idle.wait_for(lambda: not self.writing and self.readers_active == 0)
+                self.writing = True
+            else:
+                await self.idle.wait_for(lambda: not self.writing)
+                self.readers_active += 1
+
+    async def release(self, exclusive):
+        async with self.idle:
+            if exclusive:
+                self.writing = False
+            else:
+                self.readers_active -= 1
+            self.idle.notify_all()
+
+    # Runs a change, or any other non-read command, on the writer thread
+    def write_command(self, line):
+        with capture() as buffer:
+            self.cli.onecmd(line)
+        # Rebuild the in-memory indexes here so read workers do not each build their own
+        self.cli.load_connections()
+        if self.cli.engine == 'memory':
+            self.cli.load_timetable()
+        return buffer.getvalue()
+
+    async def execute(self, line, after=()):
+        loop = asyncio.get_running_loop()
+        command = self.cli.parseline(line)[0]
+
+        # Earlier requests on the same connection that this one must follow
+        if after:
+            await asyncio.wait(after)
+
+        if command == 'test':
+            return "Invalid Input: test is not available over the network\n"
+
+        if command not in READ_ONLY_COMMANDS:
+            await self.acquire(True)
+            try:
+                return await loop.run_in_executor(self.writer, self.write_command, line)
+            finally:
+                await self.release(True)
+
+        await self.acquire(False)
+        try:
+            # Cache lookups and updates stay on the event loop thread
+            key = self.cli.cache_key(line)
+            output = self.cli.cache.get(key) if key is not None else None
+            if output is None:
+                if self.reader.pool is not None:
+                    output, tags = await loop.run_in_executor(self.reader.pool, self.reader.execute, line)
+                else:
+                    output, tags = await loop.run_in_executor(self.writer, self.cli.read_command, line)
+                if key is not None:
+                    self.cli.remember(key, output, tags)
+            return output
+        finally:
+            await self.release(False)
+
+    async def handle(self, stream_reader, stream_writer):
+        responses = asyncio.Queue(PIPELINE_DEPTH)
+
+        # Writes responses back in the order the requests arrived
+        async def respond():
+            while True:
+                task = await responses.get()
+                if task is None:
+                    break
+                try:
+                    output = await task
+                except Exception as e:
+                    output = f"Error: {e}\n"
+                stream_writer.write((output + END_OF_RESPONSE + '\n').encode())
+                await stream_writer.drain()
+
+        responder = asyncio.create_task(respond())
+        # Reads since this connection's last change run together; a change waits for all of them
+        last_write = None
+        reads = []
+        try:
+            while True:
+                data = await stream_reader.readline()
+                if not data:
+                    break
+                line = data.decode(errors='replace').strip()
+                if line in ('exit', 'quit'):
+                    break
+                earlier = [last_write] if last_write is not None else []
+                if self.cli.parseline(line)[0] in READ_ONLY_COMMANDS:
+                    task = asyncio.create_task(self.execute(line, earlier))
+                    reads.append(task)
+                else:
+                    task = asyncio.create_task(self.execute(line, earlier + reads))
+                    last_write = task
+                    reads = []
+                await responses.put(task)
+
+        except ConnectionError:
+            pass
+
+        finally:
+            await responses.put(None)
+            try:
+                await responder
+            except ConnectionError:
+                pass
+            stream_writer.close()
+
+    async def serve(self, host='127.0.0.1', port=5330, unix_path=None):
+        if unix_path:
+            server = await asyncio.start_unix_server(self.handle, unix_path)
+            print(f"Serving Bus Routes commands on {unix_path}")
+        else:
+            server = await asyncio.start_server(self.handle, host, port)
+            print(f"Serving Bus Routes commands on {host}:{port}")
+        sys.stdout.flush()
+
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.reader.close()
+        self.writer.shutdown()
+        self.cli.backend.close()
+
+
+# Standalone entry point: python server.py [--host H] [--port N | --unix PATH] [--backend NAME]
+def main(argv=None):
+    from BusRoute import DatabaseCLI
+    from backends import BACKENDS, create_backend
+
+    parser = argparse.ArgumentParser(description='Serve the Bus Routes CLI commands over a socket')
+    parser.add_argument('--host', default='127.0.0.1', help='address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=5330, help='TCP port (default: 5330)')
+    parser.add_argument('--unix', metavar='PATH', help='listen on a Unix socket instead of TCP')
+    parser.add_argument('--workers', type=int, help='threads for read commands (default: up to 4)')
+    parser.add_argument('--file', default='', help='command file inside testcase/ for the run command')
+    parser.add_argument('--backend', choices=sorted(BACKENDS), default='mysql', help='storage backend (default: mysql)')
+    parser.add_argument('--sqlite-path', default='busroute.db', help='database file for the sqlite backend')
+    options = parser.parse_args(argv)
+
+    cli = DatabaseCLI(options.file, create_backend(options.backend, options.sqlite_path))
+
+    async def run():
+        server = CommandServer(cli, options.workers)
+        try:
+            await server.serve(options.host, options.port, options.unix)
+        finally:
+            server.close()
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
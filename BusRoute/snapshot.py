@@ -0,0 +1,134 @@
+import csv
+import hashlib
+import os
+import shutil
+import struct
+from array import array
+from decimal import Decimal
+
+
+# File header: magic, change log position, terminal, route and departure counts
+MAGIC = b'BUSSNAP1'
+HEADER = struct.Struct('<8sQIII')
+ROUTE = struct.Struct('<iii')  # RouteNum, TravelTime, Fare in cents
+TEXT_LENGTH = struct.Struct('<H')
+
+
+class ChangeLog:
+    """Append-only CSV of every t, b, l, r and sync that succeeded, in the same grammar as a command file.
+
+    The log position is its number of rows, which a snapshot records so that loading it only
+    needs the rows written after it was saved. A sync row names a copy of its file kept next to
+    the log, so replaying it applies the timetable that was synced, not the file as it is now.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.count = 0
+        if os.path.exists(path):
+            with open(path, newline='') as file:
+                self.count = sum(1 for row in csv.reader(file) if row)
+        self.file = open(path, 'a', newline='')
+        self.writer = csv.writer(self.file)
+        self.paused = False
+
+    def append(self, row):
+        if self.paused:
+            return
+        self.writer.writerow(row)
+        self.file.flush()
+        self.count += 1
+
+    # Records a stored row as the command that would store it again
+    def record(self, command, params):
+        if command == 'l':
+            route_num, minutes = params
+            self.append(['l', route_num, f"{minutes // 60:02d}{minutes % 60:02d}"])
+        else:
+            self.append([command, *params])
+
+    # Copies a file into the log's directory of kept files, named by its content, and returns the copy
+    def keep(self, path):
+        with open(path, 'rb') as file:
+            digest = hashlib.sha256(file.read()).hexdigest()
+        directory = self.path + '.files'
+        os.makedirs(directory, exist_ok=True)
+        copy = os.path.abspath(os.path.join(directory, digest + '.csv'))
+        if not os.path.exists(copy):
+            shutil.copyfile(path, copy)
+        return copy
+
+    def tail(self, position):
+        """Returns the rows written after the given log position."""
+
+        with open(self.path, newline='') as file:
+            rows = [row for row in csv.reader(file) if row]
+        return rows[position:]
+
+    def close(self):
+        self.file.close()
+
+
+def _write_text(file, text):
+    data = text.encode()
+    file.write(TEXT_LENGTH.pack(len(data)))
+    file.write(data)
+
+
+def _read_text(view, offset):
+    (length,) = TEXT_LENGTH.unpack_from(view, offset)
+    offset += TEXT_LENGTH.size
+    return bytes(view[offset:offset + length]).decode(), offset + length
+
+
+def save_snapshot(path, terminals, routes, departures, log_position=0):
+    """Writes the three tables to a binary snapshot; departures go out as two packed columns."""
+
+    routes = list(routes)
+    departures = sorted(departures)
+    with open(path, 'wb') as file:
+        file.write(HEADER.pack(MAGIC, log_position, len(terminals), len(routes), len(departures)))
+        for name, district in terminals:
+            _write_text(file, name)
+            _write_text(file, district)
+        for route_num, source, destination, travel_time, fare in routes:
+            file.write(ROUTE.pack(route_num, travel_time, int(Decimal(fare) * 100)))
+            _write_text(file, source)
+            _write_text(file, destination)
+        array('i', (route_num for route_num, _ in departures)).tofile(file)
+        array('H', (minutes for _, minutes in departures)).tofile(file)
+
+
+def load_snapshot(path):
+    """Returns (log position, terminals, routes, departures) read back from a snapshot."""
+
+    with open(path, 'rb') as file:
+        view = memoryview(file.read())
+
+    magic, log_position, terminal_count, route_count, departure_count = HEADER.unpack_from(view, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{path} is not a Bus Routes snapshot")
+    offset = HEADER.size
+
+    terminals = []
+    for _ in range(terminal_count):
+        name, offset = _read_text(view, offset)
+        district, offset = _read_text(view, offset)
+        terminals.append((name, district))
+
+    routes = []
+    for _ in range(route_count):
+        route_num, travel_time, cents = ROUTE.unpack_from(view, offset)
+        offset += ROUTE.size
+        source, offset = _read_text(view, offset)
+        destination, offset = _read_text(view, offset)
+        routes.append((route_num, source, destination, travel_time, Decimal(cents).scaleb(-2)))
+
+    route_nums = array('i')
+    route_nums.frombytes(view[offset:offset + departure_count * route_nums.itemsize])
+    offset += departure_count * route_nums.itemsize
+    minutes = array('H')
+    minutes.frombytes(view[offset:offset + departure_count * minutes.itemsize])
+    departures = list(zip(route_nums, minutes))
+
+    return log_position, terminals, routes, departures
@@ -0,0 +1,116 @@
+import csv
+from backends import to_fare
+from conflicts import ConflictIndex, departure_minutes
+
+
+class TimetableDiff:
+    """What changes between the stored tables and a command file, as rows for Backend.apply_delta.
+
+    Departures are compared per route: a route whose times did not change adds nothing to the
+    diff, so publishing a revision costs in proportion to what it touches.
+    """
+
+    def __init__(self):
+        self.terminals_added = []     # (Name, District)
+        self.terminals_changed = []   # (District, Name)
+        self.terminals_removed = []   # (Name,)
+        self.routes_added = []        # (RouteNum, Source, Destination, TravelTime, Fare)
+        self.routes_changed = []      # (Source, Destination, TravelTime, Fare, RouteNum)
+        self.routes_removed = []      # (RouteNum,)
+        self.departures_added = []    # (RouteNum, minutes)
+        self.departures_removed = []  # (RouteNum, minutes)
+
+    def __len__(self):
+        return sum(len(rows) for rows in vars(self).values())
+
+    def summary(self):
+        return (f"terminals +{len(self.terminals_added)} -{len(self.terminals_removed)} ~{len(self.terminals_changed)}, "
+                f"routes +{len(self.routes_added)} -{len(self.routes_removed)} ~{len(self.routes_changed)}, "
+                f"departures +{len(self.departures_added)} -{len(self.departures_removed)}")
+
+
+def read_timetable(path, name_key=lambda name: name):
+    """Returns the (terminals, routes, departures) that r followed by run of the file would store.
+
+    Rows are checked the way their handlers and the schema check them, in file order, so a row
+    the database would reject is left out here too.
+    """
+
+    terminals = {}  # name key -> (Name, District)
+    routes = {}     # RouteNum -> (RouteNum, Source, Destination, TravelTime, Fare)
+    departures = {}  # RouteNum -> set of minutes
+    conflicts = ConflictIndex()
+
+    with open(path, 'r') as file:
+        for row in csv.reader(file):
+            if not row:
+                continue
+            command = row[0].strip()
+            arguments = " ".join(part.strip() for part in row[1:]).split()
+
+            if command == 'r':
+                terminals, routes, departures = {}, {}, {}
+                conflicts = ConflictIndex()
+
+            elif command == 't' and len(arguments) == 2:
+                terminals.setdefault(name_key(arguments[0]), tuple(arguments))
+
+            elif command == 'b' and len(arguments) == 5:
+                try:
+                    route_num, travel_time = int(arguments[0]), int(arguments[3])
+                    fare = to_fare(float(arguments[4]))
+                except Exception:
+                    continue
+                source, destination = arguments[1], arguments[2]
+                if route_num not in routes and name_key(source) in terminals and name_key(destination) in terminals and travel_time > 0:
+                    routes[route_num] = (route_num, source, destination, travel_time, fare)
+
+            elif command == 'l' and len(arguments) == 2:
+                departure = departure_minutes(arguments[1])
+                if not arguments[0].lstrip('-').isdigit() or departure is None:
+                    continue
+                route_num = int(arguments[0])
+                if route_num <= 0:
+                    continue
+                if route_num in routes and not conflicts.conflicts(route_num, departure):
+                    conflicts.add(route_num, departure)
+                    departures.setdefault(route_num, set()).add(departure)
+
+    return list(terminals.values()), list(routes.values()), departures
+
+
+def diff_timetable(current, desired, name_key=lambda name: name):
+    """Compares backend.dump() output with read_timetable() output and returns a TimetableDiff."""
+
+    stored_terminals, stored_routes, stored_departures = current
+    terminals, routes, departures = desired
+    diff = TimetableDiff()
+
+    stored = {name_key(name): (name, district) for name, district in stored_terminals}
+    wanted = {name_key(name): (name, district) for name, district in terminals}
+    for key, (name, district) in wanted.items():
+        if key not in stored:
+            diff.terminals_added.append((name, district))
+        elif stored[key][1] != district:
+            diff.terminals_changed.append((district, stored[key][0]))
+    diff.terminals_removed = [(name,) for key, (name, district) in stored.items() if key not in wanted]
+
+    stored = {int(route[0]): (name_key(route[1]), name_key(route[2]), int(route[3]), to_fare(route[4])) for route in stored_routes}
+    for route_num, source, destination, travel_time, fare in routes:
+        if route_num not in stored:
+            diff.routes_added.append((route_num, source, destination, travel_time, fare))
+        elif stored[route_num] != (name_key(source), name_key(destination), travel_time, fare):
+            diff.routes_changed.append((source, destination, travel_time, fare, route_num))
+    wanted = {route[0] for route in routes}
+    diff.routes_removed = [(route_num,) for route_num in stored if route_num not in wanted]
+
+    # Per-route sets of departures added and removed
+    stored = {}
+    for route_num, minutes in stored_departures:
+        stored.setdefault(int(route_num), set()).add(int(minutes))
+    for route_num in sorted(stored.keys() | departures.keys()):
+        before, after = stored.get(route_num, set()), departures.get(route_num, set())
+        diff.departures_removed.extend((route_num, minutes) for minutes in sorted(before - after))
+        diff.departures_added.extend((route_num, minutes) for minutes in sorted(after - before))
+
+    return diff
@@ -0,0 +1,121 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from backends import TABLES, MySQLBackend, SQLiteBackend
+from schema import migrate
+
+
+# Lookups the indexes were added for: routes between two terminals, terminals of a district,
+# and the departures inside a window of minutes
+LOOKUPS = {
+    'route': "SELECT RouteNum FROM Route WHERE Source = 'TerminalA' AND Destination = 'TerminalB'",
+    'district': "SELECT Name FROM Terminal WHERE District = 'North' ORDER BY Name",
+    'window': "SELECT RouteNum FROM LeaveTime WHERE LeaveMinutes BETWEEN 480 AND 540",
+}
+
+
+# Function to return the detail column of EXPLAIN QUERY PLAN as one string
+def sqlite_plan(backend, sql):
+    return " | ".join(row[-1] for row in backend.query("EXPLAIN QUERY PLAN " + sql))
+
+
+class SQLiteSchemaTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = SQLiteBackend(':memory:')
+
+    def tearDown(self):
+        self.backend.close()
+
+    # The tables as a database made before the indexes would hold them
+    def create_tables(self):
+        for table in TABLES:
+            self.backend.connection.execute(SQLiteBackend.SCHEMA[table])
+
+    def test_explain_before_and_after(self):
+        self.create_tables()
+        before = {name: sqlite_plan(self.backend, sql) for name, sql in LOOKUPS.items()}
+        self.backend.ensure_schema()
+        after = {name: sqlite_plan(self.backend, sql) for name, sql in LOOKUPS.items()}
+
+        for name in LOOKUPS:
+            print(f"{name}: before: {before[name]}")
+            print(f"{name}: after:  {after[name]}")
+
+        self.assertIn('SCAN', before['route'])
+        self.assertIn('SEARCH Route USING COVERING INDEX idx_route_', after['route'])
+        self.assertIn('SCAN', before['district'])
+        self.assertIn('idx_terminal_district_name', after['district'])
+        self.assertIn('SCAN', before['window'])
+        self.assertIn('idx_leavetime_minutes', after['window'])
+        self.assertNotIn('SCAN', after['window'])
+
+    def test_duplicate_minutes_moved_aside(self):
+        self.create_tables()
+        connection = self.backend.connection
+        connection.executemany("INSERT INTO Terminal VALUES (?, ?)", [('TerminalA', 'North'), ('TerminalB', 'South')])
+        connection.executemany("INSERT INTO Route VALUES (?, 'TerminalA', 'TerminalB', 30, '2.50')", [(1,), (2,), (3,)])
+        # Routes 2 and 3 share 08:00 with route 1, as racing writers could leave them
+        connection.executemany("INSERT INTO LeaveTime VALUES (?, ?)", [(1, 480), (2, 480), (3, 480), (2, 600)])
+        connection.commit()
+
+        self.backend.ensure_schema()
+        self.assertEqual(sorted(self.backend.query("SELECT RouteNum, LeaveMinutes FROM LeaveTime")), [(1, 480), (2, 600)])
+        self.assertEqual(sorted(self.backend.query("SELECT RouteNum, LeaveMinutes FROM LeaveTimeConflict")), [(2, 480), (3, 480)])
+
+        # e runs ensure_schema again on the same database; it must keep succeeding
+        for attempt in range(2):
+            self.backend.schema_verified = False
+            self.assertEqual(self.backend.ensure_schema(), [])
+        self.assertEqual(len(self.backend.query("SELECT * FROM LeaveTimeConflict")), 2)
+
+
+@unittest.skipUnless(os.environ.get('BUSROUTE_TEST_MYSQL'), "set BUSROUTE_TEST_MYSQL to run against a scratch MySQL database")
+class MySQLSchemaTest(unittest.TestCase):
+
+    def setUp(self):
+        from database import Database
+        self.db = Database(db_name=os.environ.get('BUSROUTE_TEST_DB_NAME', 'busroute_test'))
+        with self.db.cursor() as cursor:
+            for table in ('SchemaVersion', 'LeaveTimeConflict') + tuple(reversed(TABLES)):
+                cursor.execute(f"DROP TABLE IF EXISTS {table}")
+            for table in TABLES:
+                cursor.execute(MySQLBackend.SCHEMA[table])
+        self.db.commit()
+
+    def tearDown(self):
+        self.db.close()
+
+    # Function to return the key column of EXPLAIN for each table in the plan
+    def plan(self, sql):
+        with self.db.cursor() as cursor:
+            cursor.execute("EXPLAIN " + sql)
+            columns = [column[0] for column in cursor.description]
+            return [dict(zip(columns, row))['key'] for row in cursor.fetchall()]
+
+    def test_explain_before_and_after(self):
+        lookups = dict(LOOKUPS, window="SELECT RouteNum FROM LeaveTime WHERE LeaveTime BETWEEN '08:00:00' AND '09:00:00'")
+        before = {name: self.plan(sql) for name, sql in lookups.items()}
+        with self.db.cursor() as cursor:
+            migrate(cursor)
+        self.db.commit()
+        lookups['window'] = LOOKUPS['window']
+        after = {name: self.plan(sql) for name, sql in lookups.items()}
+
+        for name in lookups:
+            print(f"{name}: before: {before[name]}")
+            print(f"{name}: after:  {after[name]}")
+
+        self.assertEqual(before['route'], [None])
+        self.assertIn(after['route'][0], ('idx_route_source_destination', 'idx_route_destination_source'))
+        self.assertEqual(before['district'], [None])
+        self.assertEqual(after['district'], ['idx_terminal_district_name'])
+        self.assertEqual(before['window'], [None])
+        self.assertTrue(after['window'][0].startswith('idx_leavetime_minutes'))
+
+
+if __name__ == '__main__':
+    unittest.main()
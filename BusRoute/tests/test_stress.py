@@ -0,0 +1,87 @@
+import os
+import sqlite3
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import backends
+from backends import BackendError, SQLiteBackend
+from benchmark import stress
+
+
+class StressTest(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, 'stress.db')
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    # Every run, one writer and several racing ones, must store exactly the accepted departures
+    def check(self, bulk):
+        results = stress('sqlite', self.path, 4, 3, 0, bulk)
+        for run in results['runs']:
+            print(run)
+            self.assertTrue(run['correct'], run)
+            self.assertGreater(run['stored'], 0)
+
+    def test_stress_commands(self):
+        self.check(bulk=False)
+
+    def test_stress_bulk(self):
+        self.check(bulk=True)
+
+
+class LockRetryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.backend = SQLiteBackend(':memory:')
+        self.backend.ensure_schema()
+        self.backend.add_terminal('TerminalA', 'North')
+        self.backend.add_terminal('TerminalB', 'South')
+        self.backend.add_route(1, 'TerminalA', 'TerminalB', 30, 2.50)
+        self.retry_seconds = backends.LOCK_RETRY_SECONDS
+        backends.LOCK_RETRY_SECONDS = 0
+
+        # The first two transactions find the database locked by another writer
+        self.locked = 2
+        begin = self.backend.begin
+
+        def locked_begin():
+            if self.locked:
+                self.locked -= 1
+                raise sqlite3.OperationalError("database is locked")
+            begin()
+
+        self.backend.begin = locked_begin
+
+    def tearDown(self):
+        backends.LOCK_RETRY_SECONDS = self.retry_seconds
+        self.backend.close()
+
+    def test_locked_departure_is_retried(self):
+        self.backend.add_departure(1, 480)
+        self.assertEqual(self.locked, 0)
+        self.assertEqual(self.backend.departures(1), [480])
+
+    def test_conflict_is_not_retried(self):
+        self.locked = 0
+        self.backend.add_departure(1, 480)
+        calls = []
+        self.backend.begin = lambda: calls.append(1)
+        with self.assertRaises(BackendError):
+            self.backend.add_departure(1, 490)
+        self.assertEqual(len(calls), 1)
+
+    def test_lock_retries_run_out(self):
+        self.locked = backends.LOCK_RETRIES + 1
+        with self.assertRaises(BackendError):
+            self.backend.add_departure(1, 480)
+        self.assertEqual(self.backend.departures(1), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,196 @@
+import bisect
+import heapq
+from departures import DepartureStore
+
+
+# F's bus change rule, kept from its original query: the next bus must leave at least TRANSFER_MINUTES
+# after the previous bus left, whatever its travel time. WINDOW_MINUTES is F's window after the start time.
+TRANSFER_MINUTES = 5
+WINDOW_MINUTES = 60
+
+# A and J's bus change rule: the next bus must leave at least CHANGE_MINUTES after the previous bus arrives
+CHANGE_MINUTES = 5
+
+
+# F prints by total travel time, then by the route of the last leg
+def trip_order(result):
+    return (result[-1], result[0] if len(result) == 3 else result[1] if len(result) == 4 else result[2])
+
+
+class Timetable:
+    """In-memory copy of the Terminal, Route and LeaveTime tables used by the F, J and A commands.
+
+    Departures are held once, sorted per route in a DepartureStore. The routes leaving each
+    terminal (and each terminal pair) are listed, so a trip search asks the store for those
+    routes' departures in a window instead of running self-joins in MySQL.
+    Terminals are held by name_key, so names match the way the backend compares them.
+    """
+
+    def __init__(self, terminals, routes, departures, name_key=lambda name: name):
+        # terminals: (Name, District), routes: (RouteNum, Source, Destination, TravelTime, Fare),
+        # departures: (RouteNum, minutes since midnight)
+        self.name_key = name_key
+        self.terminals = {name_key(name): district for name, district in terminals}
+        self.routes = {}
+        for route_num, source, destination, travel_time, fare in routes:
+            self.routes[route_num] = (name_key(source), name_key(destination), travel_time, fare)
+
+        # Sorted departures of each route, and the routes with departures leaving each terminal
+        # and each (source, destination) pair
+        self.departures = DepartureStore(departures)
+        self.routes_from = {}
+        self.routes_on_leg = {}
+        for route_num in self.departures.route_nums:
+            source, destination = self.routes[route_num][:2]
+            self.routes_from.setdefault(source, []).append(route_num)
+            self.routes_on_leg.setdefault((source, destination), []).append(route_num)
+
+    def _between(self, route_nums, low, high=None):
+        # (minutes, route) for the departures of the routes with low <= minutes <= high, by time
+        if route_nums is None:
+            return []
+        return self.departures.between(route_nums, low, high)
+
+    def trip_streams(self, source, destination, start_total_minutes, limit=None):
+        """Returns the direct, one-transfer and two-transfer F results as three lists, each in trip_order.
+
+        With a limit only the first limit results of each list are kept, through a bounded heap.
+        """
+
+        source, destination = self.name_key(source), self.name_key(destination)
+        end_total_minutes = start_total_minutes + WINDOW_MINUTES
+        first_legs = list(self._between(self.routes_from.get(source), start_total_minutes, end_total_minutes))
+        streams = (
+            self._direct_trips(source, destination, start_total_minutes, end_total_minutes),
+            self._one_transfer_trips(destination, first_legs),
+            self._two_transfer_trips(destination, start_total_minutes, first_legs),
+        )
+        if limit is None:
+            return [sorted(stream, key=trip_order) for stream in streams]
+        return [heapq.nsmallest(limit, stream, key=trip_order) for stream in streams]
+
+    def _direct_trips(self, source, destination, start_total_minutes, end_total_minutes):
+        for leave_time, route_num in self._between(self.routes_on_leg.get((source, destination)), start_total_minutes, end_total_minutes):
+            _, _, travel_time, fare = self.routes[route_num]
+            arrival_time_minutes = leave_time + travel_time
+            yield (route_num, fare, arrival_time_minutes - start_total_minutes)
+
+    def _one_transfer_trips(self, destination, first_legs):
+        for leave_time1, first_route in first_legs:
+            _, middle, travel_time1, fare1 = self.routes[first_route]
+            for leave_time2, second_route in self._between(self.routes_on_leg.get((middle, destination)), leave_time1 + TRANSFER_MINUTES):
+                _, _, travel_time2, fare2 = self.routes[second_route]
+                arrival_time_first_leg = leave_time1 + travel_time1
+                total_travel_time = (leave_time2 - arrival_time_first_leg + 20) + travel_time2
+                yield (first_route, second_route, fare1 + fare2, total_travel_time)
+
+    def _two_transfer_trips(self, destination, start_total_minutes, first_legs):
+        for leave_time1, first_route in first_legs:
+            _, first_stop, _, fare1 = self.routes[first_route]
+            for leave_time2, second_route in self._between(self.routes_from.get(first_stop), leave_time1 + TRANSFER_MINUTES):
+                _, second_stop, travel_time2, fare2 = self.routes[second_route]
+                for leave_time3, third_route in self._between(self.routes_on_leg.get((second_stop, destination)), leave_time2 + TRANSFER_MINUTES):
+                    _, _, travel_time3, fare3 = self.routes[third_route]
+                    arrival_time_second_leg = leave_time2 + travel_time2
+                    total_travel_time = (arrival_time_second_leg - start_total_minutes + 20) + travel_time3
+                    yield (first_route, second_route, third_route, fare1 + fare2 + fare3, total_travel_time)
+
+    @staticmethod
+    def _dominated(labels, arrival, fare, transfers):
+        # True if some label is no worse on arrival time, fare and bus changes
+        return any(label[0] <= arrival and label[1] <= fare and label[2] <= transfers for label in labels)
+
+    def journeys(self, source, destination, start_total_minutes, max_transfers=2):
+        """Returns the Pareto-optimal journeys over (arrival time, total fare, bus changes).
+
+        Each journey is (arrival minutes, fare, transfers, ((route, leave minutes), ...)), in order of
+        arrival time. A bus change needs CHANGE_MINUTES after the previous bus arrives.
+        Labels are settled in (arrival, fare, transfers) order, so a settled label is never
+        dominated later. Only the first reachable departure of each route is tried, since a later
+        one on the same route costs the same and arrives later.
+        """
+
+        source, destination = self.name_key(source), self.name_key(destination)
+        results = []   # settled labels at the destination
+        settled = {}   # terminal -> settled (arrival, fare, transfers) labels
+        counter = 0    # tie breaker so the heap never compares legs
+        heap = [(start_total_minutes, 0, 0, counter, source, ())]
+
+        while heap:
+            arrival, fare, transfers, _, terminal, legs = heapq.heappop(heap)
+
+            # A label no better than a journey already found cannot lead to a better one
+            if self._dominated(results, arrival, fare, transfers):
+                continue
+            if terminal == destination and legs:
+                results.append((arrival, fare, transfers, legs))
+                continue
+            labels = settled.setdefault(terminal, [])
+            if self._dominated(labels, arrival, fare, transfers):
+                continue
+            labels.append((arrival, fare, transfers))
+
+            if len(legs) > max_transfers:
+                continue
+            ready = arrival + CHANGE_MINUTES if legs else arrival
+
+            for route_num in self.routes_from.get(terminal, ()):
+                start, end = self.departures.span(route_num)
+                index = bisect.bisect_left(self.departures.minutes, ready, start, end)
+                if index == end:
+                    continue
+                leave_time = self.departures.minutes[index]
+                _, next_terminal, travel_time, route_fare = self.routes[route_num]
+                next_label = (leave_time + travel_time, fare + route_fare, len(legs))
+                if self._dominated(results, *next_label) or self._dominated(settled.get(next_terminal, ()), *next_label):
+                    continue
+                counter += 1
+                heapq.heappush(heap, next_label + (counter, next_terminal, legs + ((route_num, leave_time),)))
+
+        return results
+
+    def earliest_arrival(self, source, destination, start_total_minutes):
+        """Returns the legs ((route, leave minutes, arrive minutes), ...) of the earliest arrival, or None.
+
+        A time-dependent Dijkstra over terminals: from each settled terminal, every route leaving it
+        is boarded at its next departure, found by binary search, allowing CHANGE_MINUTES after
+        arriving by bus. There is no limit on bus changes and no time window.
+        """
+
+        source, destination = self.name_key(source), self.name_key(destination)
+        arrival = {source: start_total_minutes}
+        previous = {}  # terminal -> (terminal it was reached from, route, leave minutes)
+        settled = set()
+        heap = [(start_total_minutes, source)]
+
+        while heap:
+            time, terminal = heapq.heappop(heap)
+            if terminal in settled:
+                continue
+            settled.add(terminal)
+            if terminal == destination:
+                break
+
+            ready = time + CHANGE_MINUTES if terminal in previous else time
+            for route_num in self.routes_from.get(terminal, ()):
+                start, end = self.departures.span(route_num)
+                index = bisect.bisect_left(self.departures.minutes, ready, start, end)
+                if index == end:
+                    continue
+                leave_time = self.departures.minutes[index]
+                _, next_terminal, travel_time, _ = self.routes[route_num]
+                if next_terminal not in settled and leave_time + travel_time < arrival.get(next_terminal, leave_time + travel_time + 1):
+                    arrival[next_terminal] = leave_time + travel_time
+                    previous[next_terminal] = (terminal, route_num, leave_time)
+                    heapq.heappush(heap, (leave_time + travel_time, next_terminal))
+
+        if destination not in previous:
+            return None
+
+        legs = []
+        terminal = destination
+        while terminal != source:
+            from_terminal, route_num, leave_time = previous[terminal]
+            legs.append((route_num, leave_time, arrival[terminal]))
+            terminal = from_terminal
+        return tuple(reversed(legs))